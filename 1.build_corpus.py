@@ -9,6 +9,9 @@ run.py ― Dataset recorder for LibriSpeech‑style structure
 * Shows each prompt on‑screen; press Enter to start and stop recording.
 * Can be interrupted (Ctrl‑C or [q]) and resumed later; existing audio files
   are detected and skipped so you never re‑record finished lines.
+* By default each take is encoded to a temporary FLAC while you speak and
+  renamed into place when you keep it, so there is no wait between
+  sentences (--record_mode memory keeps the old record‑then‑write path).
 
 Dependencies
 ------------
@@ -23,8 +26,10 @@ Quick start
 from __future__ import annotations
 
 import argparse
+import os
 import re
 import sys
+import threading
 from pathlib import Path
 from typing import List, Tuple
 
@@ -40,6 +45,8 @@ import json
 SR = 16_000        # sample‑rate (Hz)
 CHANNELS = 1
 SUBTYPE = "PCM_16"  # 16‑bit FLAC
+RING_SECONDS = 10   # audio the ring buffer holds if the writer falls behind
+WRITER_POLL_S = 0.05
 
 
 
@@ -86,6 +93,9 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("--transcripts_dir", default=".", help="Directory containing *.trans.txt files")
     p.add_argument("--out_dir", default=".", help="Root directory where audio folders will be created")
     p.add_argument("--sr", type=int, default=SR, help="Sample rate (default 16 kHz)")
+    p.add_argument("--record_mode", choices=["stream", "memory"], default="stream",
+                   help="stream: encode each take to a temp FLAC while recording; "
+                        "memory: record to RAM and write the FLAC when the take is kept")
     return p.parse_args()
 
 
@@ -132,6 +142,118 @@ def record_once(sr: int) -> np.ndarray:
     return np.concatenate(chunks, axis=0)
 
 
+class RingBuffer:
+    """Single‑producer / single‑consumer ring of audio frames.
+
+    The audio callback only copies into the array and then advances
+    `write_pos`; the writer thread only advances `read_pos`. Each index has a
+    single owner, so neither side ever takes a lock.
+    """
+
+    def __init__(self, frames: int, channels: int):
+        self.buf = np.zeros((frames, channels), dtype=np.float32)
+        self.size = frames
+        self.write_pos = 0
+        self.read_pos = 0
+        self.dropped = 0
+
+    def write(self, block: np.ndarray):
+        n = len(block)
+        if n > self.size - (self.write_pos - self.read_pos):
+            self.dropped += n
+            return
+        start = self.write_pos % self.size
+        first = min(n, self.size - start)
+        self.buf[start:start + first] = block[:first]
+        self.buf[:n - first] = block[first:]
+        self.write_pos += n
+
+    def read(self) -> np.ndarray:
+        n = self.write_pos - self.read_pos
+        start = self.read_pos % self.size
+        first = min(n, self.size - start)
+        out = np.concatenate([self.buf[start:start + first], self.buf[:n - first]])
+        self.read_pos += n
+        return out
+
+
+class StreamingTake:
+    """One take recorded straight into a hidden temp FLAC next to `path`."""
+
+    def __init__(self, path: Path, sr: int):
+        self.path = path
+        self.tmp_path = path.with_name(f".{path.name}.part")
+        self.sr = sr
+        self.frames = 0
+        self.ring = RingBuffer(sr * RING_SECONDS, CHANNELS)
+        self._done = threading.Event()
+
+    def _write_loop(self, out: sf.SoundFile):
+        while not self._done.wait(WRITER_POLL_S):
+            self._drain(out)
+        self._drain(out)
+
+    def _drain(self, out: sf.SoundFile):
+        block = self.ring.read()
+        if len(block):
+            out.write(block)
+            self.frames += len(block)
+
+    def record(self):
+        print("Recording… (press Enter again to stop)")
+        out = sf.SoundFile(self.tmp_path, "w", self.sr, CHANNELS, SUBTYPE, format="FLAC")
+        writer = threading.Thread(target=self._write_loop, args=(out,), daemon=True)
+        writer.start()
+        try:
+            with sd.InputStream(samplerate=self.sr, channels=CHANNELS, dtype="float32",
+                                callback=lambda indata, *_: self.ring.write(indata)):
+                input()  # wait for Enter
+        finally:
+            self._done.set()
+            writer.join()
+            out.close()
+        if self.ring.dropped:
+            print(f"⚠️  {self.ring.dropped / self.sr:.2f}s of audio dropped (disk too slow?)")
+
+    def keep(self):
+        os.replace(self.tmp_path, self.path)
+
+    def discard(self):
+        self.tmp_path.unlink(missing_ok=True)
+
+
+class MemoryTake:
+    """One take buffered in memory and encoded when it is kept."""
+
+    def __init__(self, path: Path, sr: int):
+        self.path = path
+        self.sr = sr
+        self.audio = np.empty((0, CHANNELS))
+
+    @property
+    def frames(self) -> int:
+        return len(self.audio)
+
+    def record(self):
+        self.audio = record_once(self.sr)
+
+    def keep(self):
+        sf.write(self.path, self.audio, self.sr, format="FLAC", subtype=SUBTYPE)
+
+    def discard(self):
+        self.audio = np.empty((0, CHANNELS))
+
+
+def record_take(path: Path, sr: int, mode: str):
+    take = StreamingTake(path, sr) if mode == "stream" else MemoryTake(path, sr)
+    try:
+        take.record()
+    except BaseException:
+        take.discard()
+        raise
+    return take
+
+
 def ensure_dir(p: Path):
     p.mkdir(parents=True, exist_ok=True)
 
@@ -183,6 +305,7 @@ def main() -> None:
                 input(">>> Press Enter to start recording <<<")
                 break
 
+        take = None
         try:
             for idx, text in enumerate(entries):
                 sentence_index = idx + 1
@@ -194,8 +317,9 @@ def main() -> None:
 
                 next_text = entries[idx+1] if idx+1 < total else None
 
-                audio = record_once(a.sr)
-                if audio.size == 0:
+                take = record_take(wav_path, a.sr, a.record_mode)
+                if take.frames == 0:
+                    take.discard()
                     print("⚠️  No audio captured. Skipping line.")
                     continue
 
@@ -209,17 +333,21 @@ def main() -> None:
                         print("\n────────────────────────────────────────")
                         print(f"Sentence {idx+1}/{total}: {text}")
                         input(">>> Press Enter to start recording <<<")
-                        audio = record_once(a.sr)
+                        take.discard()
+                        take = record_take(wav_path, a.sr, a.record_mode)
                         continue
                     if choice == "q":
+                        take.discard()
                         print("Interrupted by user. All saved recordings remain. Bye!")
                         sys.exit(0)
                     # keep
-                    sf.write(wav_path, audio, a.sr, format="FLAC", subtype=SUBTYPE)
+                    take.keep()
                     with transcript_file.open("a", encoding="utf-8") as tf:
                         tf.write(f"{utt_id} {text}\n")
                     break
         except KeyboardInterrupt:
+            if take is not None:
+                take.discard()
             print("\nInterrupted! Your recordings are safe. Rerun to continue.")
             sys.exit(0)
 
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+export_corpus.py ― Kaldi data dir and MFA corpus from the recorder's output
+===========================================================================
+* Walks a corpus written by 1.build_corpus.py
+  (<root>/<speaker_id>/<chapter_id>/transcript.txt next to <utt_id>.flac)
+  once and writes both input formats the pipelines need:
+    <kaldi_dir>/wav.scp, text, utt2spk, spk2utt   (kaldi_gop_pipelines/data_prep.sh)
+    <mfa_dir>/<speaker_id>/<utt_id>.wav + .lab     (mfa/, 16 kHz mono 16-bit WAV)
+  wav.scp points at the MFA WAVs, so every recording is transcoded once.
+* Transcoding runs in a process pool. <mfa_dir>/.export_manifest.json keeps
+  the SHA-256 of every source FLAC (with its mtime and size, so unchanged
+  files are not even read), and a re-run only transcodes utterances that are
+  new or whose audio changed; .lab files are only rewritten when the text
+  changed. Utterances that disappeared from the corpus are removed.
+
+Dependencies
+------------
+    pip install soundfile numpy
+    pip install soxr        # only for recordings that are not 16 kHz
+
+Quick start
+-----------
+    python 4.export_corpus.py data --kaldi_dir data/s5 --mfa_dir mfa_corpus --workers 8
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+
+SR = 16_000
+SUBTYPE = "PCM_16"
+MANIFEST_NAME = ".export_manifest.json"
+# a manifest written for another output format is ignored
+FORMAT = f"{SR}/{SUBTYPE}/mono"
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Export a recorded corpus for Kaldi and MFA")
+    p.add_argument("corpus", help="Root written by 1.build_corpus.py")
+    p.add_argument("--kaldi_dir", default="data/s5", help="Kaldi data directory to write")
+    p.add_argument("--mfa_dir", default="mfa_corpus", help="MFA corpus directory to write")
+    p.add_argument("--workers", type=int, default=os.cpu_count(), help="Transcoding processes")
+    p.add_argument("--force", action="store_true", help="Transcode everything, ignoring the manifest")
+    return p.parse_args()
+
+
+def discover_utterances(root: Path) -> dict[str, dict]:
+    """utt_id -> {speaker, source, text} for every transcript line whose FLAC exists."""
+    utterances = {}
+    for transcript in sorted(root.glob("*/*/transcript.txt")):
+        speaker = transcript.parent.parent.name
+        with transcript.open(encoding="utf-8") as fh:
+            for line in fh:
+                parts = line.strip().split(maxsplit=1)
+                if len(parts) != 2:
+                    continue
+                utt_id, text = parts
+                source = transcript.parent / f"{utt_id}.flac"
+                if source.exists():
+                    # a line written twice (re-recorded take) keeps the last text
+                    utterances[utt_id] = {"speaker": speaker, "source": str(source), "text": text}
+    return utterances
+
+
+def load_manifest(path: Path) -> dict:
+    try:
+        with path.open(encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable manifest {path}: {e}")
+        return {}
+    if manifest.get("format") != FORMAT:
+        return {}
+    return manifest.get("utterances", {})
+
+
+def save_manifest(path: Path, entries: dict):
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump({"format": FORMAT, "utterances": entries}, f)
+    os.replace(tmp, path)
+
+
+def transcode(source: str, target: str, known_hash: str | None):
+    """Hash `source`; unless the hash is `known_hash` and `target` exists, write
+    it to `target` as 16 kHz mono WAV. Returns (hash, transcoded, error)."""
+    try:
+        data = Path(source).read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+        if digest == known_hash and os.path.exists(target):
+            return digest, False, None
+
+        audio, sr = sf.read(io.BytesIO(data), dtype="float32", always_2d=True)
+        audio = audio.mean(axis=1)
+        if sr != SR:
+            import soxr
+
+            audio = soxr.resample(audio, sr, SR)
+        tmp = f"{target}.part"
+        sf.write(tmp, np.clip(audio, -1.0, 1.0), SR, subtype=SUBTYPE, format="WAV")
+        os.replace(tmp, target)
+        return digest, True, None
+    except Exception as e:
+        return None, False, f"{type(e).__name__}: {e}"
+
+
+def write_text_if_changed(path: Path, text: str) -> bool:
+    if path.exists() and path.read_text(encoding="utf-8") == text:
+        return False
+    path.write_text(text, encoding="utf-8")
+    return True
+
+
+def write_lines(path: Path, lines: list[str]):
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.writelines(f"{line}\n" for line in lines)
+    os.replace(tmp, path)
+
+
+def write_kaldi(kaldi_dir: Path, utterances: dict[str, dict], wav_paths: dict[str, Path]):
+    # Kaldi wants every file sorted by utt_id in C locale order, which is
+    # Python's str order for these ASCII ids; utt_ids start with the speaker
+    # id, so utt2spk sorted by utt_id is sorted by speaker as well
+    kaldi_dir.mkdir(parents=True, exist_ok=True)
+    utt_ids = sorted(utterances)
+    write_lines(kaldi_dir / "wav.scp", [f"{u} {wav_paths[u].resolve()}" for u in utt_ids])
+    write_lines(kaldi_dir / "text", [f"{u} {utterances[u]['text']}" for u in utt_ids])
+    write_lines(kaldi_dir / "utt2spk", [f"{u} {utterances[u]['speaker']}" for u in utt_ids])
+    spk2utt = {}
+    for u in utt_ids:
+        spk2utt.setdefault(utterances[u]["speaker"], []).append(u)
+    write_lines(kaldi_dir / "spk2utt", [f"{s} {' '.join(us)}" for s, us in sorted(spk2utt.items())])
+
+
+def main() -> None:
+    a = parse_args()
+    mfa_dir, kaldi_dir = Path(a.mfa_dir), Path(a.kaldi_dir)
+    mfa_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = mfa_dir / MANIFEST_NAME
+    manifest = {} if a.force else load_manifest(manifest_path)
+
+    utterances = discover_utterances(Path(a.corpus))
+    print(f"{len(utterances)} utterances found in {a.corpus}")
+
+    wav_paths = {u: mfa_dir / e["speaker"] / f"{u}.wav" for u, e in utterances.items()}
+    entries, jobs = {}, []
+    for utt_id, utt in utterances.items():
+        stat = os.stat(utt["source"])
+        known = manifest.get(utt_id)
+        key = {"source": utt["source"], "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+        if known and all(known.get(k) == v for k, v in key.items()) and wav_paths[utt_id].exists():
+            entries[utt_id] = known
+        else:
+            wav_paths[utt_id].parent.mkdir(parents=True, exist_ok=True)
+            entries[utt_id] = key
+            jobs.append((utt_id, known.get("sha256") if known else None))
+
+    untouched, transcoded, failed = len(utterances) - len(jobs), 0, []
+    if jobs:
+        with ProcessPoolExecutor(a.workers) as pool:
+            results = pool.map(
+                transcode,
+                [utterances[u]["source"] for u, _ in jobs],
+                [str(wav_paths[u]) for u, _ in jobs],
+                [h for _, h in jobs],
+                chunksize=8,
+            )
+            for (utt_id, _), (digest, done, error) in zip(jobs, results):
+                if error is not None:
+                    print(f"⚠️  skipped {utterances[utt_id]['source']}: {error}")
+                    failed.append(utt_id)
+                    continue
+                entries[utt_id]["sha256"] = digest
+                transcoded += done
+    for utt_id in failed:
+        del utterances[utt_id], entries[utt_id]
+
+    labels = sum(
+        write_text_if_changed(wav_paths[u].with_suffix(".lab"), utterances[u]["text"]) for u in utterances
+    )
+
+    # utterances no longer in the corpus (or no longer readable)
+    removed = 0
+    for utt_id in set(manifest) - set(entries):
+        wav = mfa_dir / manifest[utt_id].get("speaker", "") / f"{utt_id}.wav"
+        for path in (wav, wav.with_suffix(".lab")):
+            if path.exists():
+                path.unlink()
+        removed += 1
+    for utt_id, utt in utterances.items():
+        entries[utt_id]["speaker"] = utt["speaker"]
+    save_manifest(manifest_path, entries)
+
+    write_kaldi(kaldi_dir, utterances, wav_paths)
+    print(f"{transcoded} transcoded, {len(jobs) - transcoded - len(failed)} unchanged after hashing, "
+          f"{untouched} untouched, {labels} .lab written, {removed} removed, {len(failed)} failed")
+    print(f"\n🎉  Kaldi data dir in {kaldi_dir}, MFA corpus in {mfa_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+corpus_stats.py ― CHAPTERS / SPEAKERS files from one pass over the corpus
+=========================================================================
+* Run from the directory holding the per-user folders
+  (<user_folder>/user_config.json, resources.json, <user_id>/<chapter_id>/*.flac).
+* Durations come from the FLAC/WAV header via soundfile, no ffprobe.
+* Every duration is kept in .duration_index.json keyed by path, mtime and
+  size, so later runs only read headers of new or changed files.
+
+Dependencies
+------------
+    pip install soundfile
+
+Quick start
+-----------
+    python corpus_stats.py          # writes CHAPTERS and SPEAKERS
+"""
+from __future__ import annotations
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import soundfile as sf
+
+
+INDEX_PATH = ".duration_index.json"
+CHAPTERS_SUBSET = "train-clean-60"
+SPEAKERS_SUBSET = "train-clean-16"
+
+
+def get_duration(file_path: str) -> float:
+    try:
+        info = sf.info(file_path)
+        return info.frames / info.samplerate
+    except Exception as e:
+        print(f"Failed to read {file_path}: {e}")
+        return 0.0
+
+
+class DurationIndex:
+    """path -> duration, invalidated when a file's mtime or size changes."""
+
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        self.entries: dict = {}
+        self.seen: set = set()
+        if os.path.isfile(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable duration index {path}: {e}")
+
+    def durations(self, files: list[str]) -> list[float]:
+        found, missing = {}, []
+        for f in files:
+            stat = os.stat(f)
+            key = [stat.st_mtime_ns, stat.st_size]
+            self.seen.add(f)
+            entry = self.entries.get(f)
+            if entry and entry[:2] == key:
+                found[f] = entry[2]
+            else:
+                missing.append((f, key))
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                read = executor.map(get_duration, [f for f, _ in missing])
+                for (f, key), duration in zip(missing, read):
+                    found[f] = duration
+                    # unreadable files are not indexed, so they are retried next run
+                    if duration > 0:
+                        self.entries[f] = key + [duration]
+                    else:
+                        self.entries.pop(f, None)
+
+        return [found[f] for f in files]
+
+    def save(self):
+        # drop files that no longer exist in the corpus
+        entries = {f: e for f, e in self.entries.items() if f in self.seen}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp, self.path)
+
+
+def get_all_flac_files(folder: str) -> list[str]:
+    return [os.path.join(dp, f) for dp, _, files in os.walk(folder) for f in files if f.endswith('.flac')]
+
+
+def collect(root: str = ".", index: DurationIndex | None = None) -> list[dict]:
+    """One walk over every user folder under `root`.
+
+    Returns one dict per user folder with its config, resources (None when
+    resources.json is missing), total seconds/files and per-chapter
+    seconds/files.
+    """
+    index = index or DurationIndex()
+    users = []
+    for user_folder in os.listdir(root):
+        user_folder = os.path.join(root, user_folder)
+        if not os.path.isdir(user_folder):
+            continue
+
+        config_path = os.path.join(user_folder, "user_config.json")
+        resources_path = os.path.join(user_folder, "resources.json")
+        if not os.path.isfile(config_path):
+            continue
+
+        try:
+            with open(config_path, "r", encoding="utf-8") as f:
+                config = json.load(f)
+            resources = None
+            if os.path.isfile(resources_path):
+                try:
+                    with open(resources_path, "r", encoding="utf-8") as f:
+                        resources = json.load(f)
+                except Exception as e:
+                    print(f"Error reading {resources_path}: {e}")
+
+            user_id = config.get("id", "UNKNOWN")
+            user = {"config": config, "resources": resources, "seconds": 0.0, "files": 0, "chapters": {}}
+            users.append(user)
+
+            user_audio_root = os.path.join(user_folder, user_id)
+            if not os.path.isdir(user_audio_root):
+                continue
+
+            for entry in os.listdir(user_audio_root):
+                path = os.path.join(user_audio_root, entry)
+                if os.path.isdir(path):
+                    files = get_all_flac_files(path)
+                elif entry.endswith('.flac'):
+                    files = [path]
+                else:
+                    continue
+                seconds = sum(index.durations(files))
+                user["seconds"] += seconds
+                user["files"] += len(files)
+                if os.path.isdir(path):
+                    user["chapters"][entry] = {"seconds": seconds, "files": len(files)}
+
+        except Exception as e:
+            print(f"Error processing folder {user_folder}: {e}")
+
+    return users
+
+
+def chapters_lines(users: list[dict], subset_name: str = CHAPTERS_SUBSET) -> list[str]:
+    lines = [";ID        |READER|MINUTES|NUM_FILES| SUBSET         | TITLE"]
+    for user in users:
+        if user["resources"] is None:
+            continue
+        user_id = user["config"].get("id", "UNKNOWN")
+        for chapter_id, stats in user["chapters"].items():
+            minutes, num_files = round(stats["seconds"] / 60, 2), stats["files"]
+            chapter_title = user["resources"].get(chapter_id, "UNKNOWN")
+            line = f"{chapter_id:<10}|{user_id:<6}|{minutes:<7}|{num_files:<9}|{subset_name:<16}|{chapter_title}"
+            lines.append(line)
+    return lines
+
+
+def speakers_lines(users: list[dict], subset_name: str = SPEAKERS_SUBSET) -> list[str]:
+    lines = [";ID  |SEX| SUBSET          |MINUTES|NUM_FILES| NAME"]
+    for user in users:
+        config = user["config"]
+        user_id = config.get("id", "UNKNOWN")
+        gender = config.get("gender", "U")
+        name = config.get("name", "UNKNOWN")
+        minutes, num_files = user["seconds"] / 60, user["files"]
+        line = f"{user_id}|{gender}|{subset_name:<17}|{minutes:<7}|{num_files:<9}|{name}"
+        lines.append(line)
+    return lines
+
+
+def write_lines(path: str, lines: list[str]):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+
+
+def main():
+    index = DurationIndex()
+    users = collect(".", index)
+    index.save()
+
+    write_lines("CHAPTERS", chapters_lines(users))
+    print("CHAPTERS file created at: CHAPTERS")
+    write_lines("SPEAKERS", speakers_lines(users))
+    print("SPEAKERS file successfully created at: SPEAKERS")
+
+
+if __name__ == "__main__":
+    main()
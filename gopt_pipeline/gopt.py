@@ -0,0 +1,321 @@
+"""
+gopt.py ― GOPT model, checkpoint loading, batched scoring and export
+===================================================================
+The model classes used to live in GOPT_GPU.ipynb; the notebook now imports
+them from here.
+
+* load()   builds GOPT from best_audio_model.pth (the 'module.' prefix of
+           the DataParallel checkpoint is stripped); input and embedding
+           sizes are read from the checkpoint, so any --am works
+* score()  scores a padded batch, running only as many positions as the
+           longest utterance in it, and trims every output to its length
+* export   TorchScript (Scorer, lengths handled inside) or ONNX (GOPT
+           forward with dynamic batch/length; the caller trims)
+
+Quick start
+-----------
+    python gopt.py exp/models/best_audio_model.pth --torchscript gopt.pt --onnx gopt.onnx
+"""
+import argparse
+import math
+import warnings
+from typing import List, Optional, Tuple
+
+import torch
+import torch.nn as nn
+import numpy as np
+
+# code from the t2t-vit paper
+def get_sinusoid_encoding(n_position, d_hid):
+    ''' Sinusoid position encoding table '''
+
+    def get_position_angle_vec(position):
+        return [position / np.power(10000, 2 * (hid_j // 2) / d_hid) for hid_j in range(d_hid)]
+
+    sinusoid_table = np.array([get_position_angle_vec(pos_i) for pos_i in range(n_position)])
+    sinusoid_table[:, 0::2] = np.sin(sinusoid_table[:, 0::2])  # dim 2i
+    sinusoid_table[:, 1::2] = np.cos(sinusoid_table[:, 1::2])  # dim 2i+1
+
+    return torch.FloatTensor(sinusoid_table).unsqueeze(0)
+
+
+def _no_grad_trunc_normal_(tensor, mean, std, a, b):
+    def norm_cdf(x):
+        return (1. + math.erf(x / math.sqrt(2.))) / 2.
+
+    if (mean < a - 2 * std) or (mean > b + 2 * std):
+        warnings.warn(
+            "mean is more than 2 std from [a, b] in nn.init.trunc_normal_. "
+            "The distribution of values may be incorrect.",
+            stacklevel=2
+        )
+
+    with torch.no_grad():
+        l = norm_cdf((a - mean) / std)
+        u = norm_cdf((b - mean) / std)
+
+        tensor.uniform_(2 * l - 1, 2 * u - 1)
+
+        tensor.erfinv_()
+
+        tensor.mul_(std * math.sqrt(2.))
+        tensor.add_(mean)
+
+        tensor.clamp_(min=a, max=b)
+        return tensor
+
+def trunc_normal_(tensor, mean=0., std=1., a=-2., b=2.):
+    return _no_grad_trunc_normal_(tensor, mean, std, a, b)
+
+
+class Attention(nn.Module):
+    def __init__(self, dim, num_heads=8, qkv_bias=False, qk_scale=None, attn_drop=0., proj_drop=0.):
+        super().__init__()
+        self.num_heads = num_heads
+        head_dim = dim // num_heads
+        self.scale = qk_scale or head_dim ** -0.5
+
+        self.qkv = nn.Linear(dim, dim * 3, bias=qkv_bias)
+        self.attn_drop = nn.Dropout(attn_drop)
+        self.proj = nn.Linear(dim, dim)
+        self.proj_drop = nn.Dropout(proj_drop)
+
+    def forward(self, x, key_padding_mask: Optional[torch.Tensor] = None):
+        # key_padding_mask: [B, N], True for padded positions that should not be attended to
+        B, N, C = x.shape
+        qkv = self.qkv(x).reshape(B, N, 3, self.num_heads, C // self.num_heads).permute(2, 0, 3, 1, 4)
+        q, k, v = qkv[0], qkv[1], qkv[2]
+
+        attn = (q @ k.transpose(-2, -1)) * self.scale
+        if key_padding_mask is not None:
+            # the cls tokens are never masked, so no row is all -inf
+            attn = attn.masked_fill(key_padding_mask[:, None, None, :], float('-inf'))
+        attn = attn.softmax(dim=-1)
+        attn = self.attn_drop(attn)
+
+        x = (attn @ v).transpose(1, 2).reshape(B, N, C)
+        x = self.proj(x)
+        x = self.proj_drop(x)
+        return x
+
+class Mlp(nn.Module):
+    def __init__(self, in_features, hidden_features=None, out_features=None, act_layer=nn.GELU, drop=0.):
+        super().__init__()
+        out_features = out_features or in_features
+        hidden_features = hidden_features or in_features
+        self.fc1 = nn.Linear(in_features, hidden_features)
+        self.act = act_layer()
+        self.fc2 = nn.Linear(hidden_features, out_features)
+        self.drop = nn.Dropout(drop)
+
+    def forward(self, x):
+        x = self.fc1(x)
+        x = self.act(x)
+        x = self.drop(x)
+        x = self.fc2(x)
+        x = self.drop(x)
+        return x
+
+class Block(nn.Module):
+
+    def __init__(self, dim, num_heads, mlp_ratio=4., qkv_bias=False, qk_scale=None, drop=0., attn_drop=0.,
+                 drop_path=0., act_layer=nn.GELU, norm_layer=nn.LayerNorm):
+        super().__init__()
+        self.norm1 = norm_layer(dim)
+        self.attn = Attention(
+            dim, num_heads=num_heads, qkv_bias=qkv_bias, qk_scale=qk_scale, attn_drop=attn_drop, proj_drop=drop)
+        self.drop_path = nn.Identity()
+        self.norm2 = norm_layer(dim)
+        mlp_hidden_dim = int(dim * mlp_ratio)
+        self.mlp = Mlp(in_features=dim, hidden_features=mlp_hidden_dim, act_layer=act_layer, drop=drop)
+
+    def forward(self, x, key_padding_mask: Optional[torch.Tensor] = None):
+        x = x + self.drop_path(self.attn(self.norm1(x), key_padding_mask))
+        x = x + self.drop_path(self.mlp(self.norm2(x)))
+        return x
+
+class GOPT(nn.Module):
+    def __init__(self, embed_dim, num_heads, depth, input_dim=84):
+        super().__init__()
+        self.input_dim = input_dim
+        self.embed_dim = embed_dim
+        self.blocks = nn.ModuleList([Block(dim=embed_dim, num_heads=num_heads) for i in range(depth)])
+
+        self.pos_embed = nn.Parameter(torch.zeros(1, 55, self.embed_dim))
+        trunc_normal_(self.pos_embed, std=.02)
+
+        self.in_proj = nn.Linear(self.input_dim, embed_dim)
+        self.mlp_head_phn = nn.Sequential(nn.LayerNorm(embed_dim), nn.Linear(embed_dim, 1))
+
+        self.mlp_head_word1 = nn.Sequential(nn.LayerNorm(embed_dim), nn.Linear(embed_dim, 1))
+        self.mlp_head_word2 = nn.Sequential(nn.LayerNorm(embed_dim), nn.Linear(embed_dim, 1))
+        self.mlp_head_word3 = nn.Sequential(nn.LayerNorm(embed_dim), nn.Linear(embed_dim, 1))
+
+        self.phn_proj = nn.Linear(40, embed_dim)
+
+        self.cls_token1 = nn.Parameter(torch.zeros(1, 1, embed_dim))
+        self.mlp_head_utt1 = nn.Sequential(nn.LayerNorm(embed_dim), nn.Linear(embed_dim, 1))
+        self.cls_token2 = nn.Parameter(torch.zeros(1, 1, embed_dim))
+        self.mlp_head_utt2 = nn.Sequential(nn.LayerNorm(embed_dim), nn.Linear(embed_dim, 1))
+        self.cls_token3 = nn.Parameter(torch.zeros(1, 1, embed_dim))
+        self.mlp_head_utt3 = nn.Sequential(nn.LayerNorm(embed_dim), nn.Linear(embed_dim, 1))
+        self.cls_token4 = nn.Parameter(torch.zeros(1, 1, embed_dim))
+        self.mlp_head_utt4 = nn.Sequential(nn.LayerNorm(embed_dim), nn.Linear(embed_dim, 1))
+        self.cls_token5 = nn.Parameter(torch.zeros(1, 1, embed_dim))
+        self.mlp_head_utt5 = nn.Sequential(nn.LayerNorm(embed_dim), nn.Linear(embed_dim, 1))
+
+        trunc_normal_(self.cls_token1, std=.02)
+        trunc_normal_(self.cls_token2, std=.02)
+        trunc_normal_(self.cls_token3, std=.02)
+        trunc_normal_(self.cls_token4, std=.02)
+        trunc_normal_(self.cls_token5, std=.02)
+
+    def forward(self, x, phn, key_padding_mask: Optional[torch.Tensor] = None):
+        # key_padding_mask: [B, T], True for padded phones; without it padded
+        # phones are attended to, as in the original GOPT
+
+        B = x.shape[0]
+
+        phn_one_hot = torch.nn.functional.one_hot(phn.long()+1, num_classes=40).float()
+        phn_embed = self.phn_proj(phn_one_hot)
+
+        if self.embed_dim != self.input_dim:
+            x = self.in_proj(x)
+
+        x = x + phn_embed
+
+        cls_token1 = self.cls_token1.expand(B, -1, -1)
+        cls_token2 = self.cls_token2.expand(B, -1, -1)
+        cls_token3 = self.cls_token3.expand(B, -1, -1)
+        cls_token4 = self.cls_token4.expand(B, -1, -1)
+        cls_token5 = self.cls_token5.expand(B, -1, -1)
+
+        x = torch.cat((cls_token1, cls_token2, cls_token3, cls_token4, cls_token5, x), dim=1)
+
+        # only as many positions as the (possibly trimmed) input has
+        x = x + self.pos_embed[:, :x.shape[1]]
+
+        if key_padding_mask is not None:
+            # the 5 cls tokens are never padding
+            key_padding_mask = torch.cat((torch.zeros(B, 5, dtype=torch.bool, device=x.device), key_padding_mask), dim=1)
+        for blk in self.blocks:
+            x = blk(x, key_padding_mask)
+
+        u1 = self.mlp_head_utt1(x[:, 0])
+        u2 = self.mlp_head_utt2(x[:, 1])
+        u3 = self.mlp_head_utt3(x[:, 2])
+        u4 = self.mlp_head_utt4(x[:, 3])
+        u5 = self.mlp_head_utt5(x[:, 4])
+
+        p = self.mlp_head_phn(x[:, 5:])
+
+        w1 = self.mlp_head_word1(x[:, 5:])
+        w2 = self.mlp_head_word2(x[:, 5:])
+        w3 = self.mlp_head_word3(x[:, 5:])
+        return u1, u2, u3, u4, u5, p, w1, w2, w3
+
+
+class Scorer(nn.Module):
+    """GOPT on a padded batch, cut down to the longest utterance.
+
+    feats [B, T, input_dim] (normalized like GoPDataset), phns [B, T] phone ids
+    (-1 for padding), lengths [B]. Returns utt [B, 5], phn [B, T'] and word
+    [B, T', 3] with T' = lengths.max().
+
+    Padded phones are masked out of attention, so every utterance gets the
+    same scores whatever it is batched with. Models trained with --bucket
+    (masked) score exactly as in training; older checkpoints were trained
+    attending over 50 padded positions and score slightly differently.
+    """
+    def __init__(self, model: GOPT):
+        super().__init__()
+        self.model = model
+
+    def forward(self, feats, phns, lengths) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        T = int(lengths.max())
+        key_padding_mask = torch.arange(T, device=lengths.device)[None, :] >= lengths[:, None]
+        u1, u2, u3, u4, u5, p, w1, w2, w3 = self.model(feats[:, :T], phns[:, :T], key_padding_mask)
+        return torch.cat((u1, u2, u3, u4, u5), dim=1), p.squeeze(2), torch.cat((w1, w2, w3), dim=2)
+
+
+def load(path, embed_dim=None, num_heads=1, depth=3, input_dim=None, map_location='cpu'):
+    """GOPT in eval mode from a checkpoint saved by the training notebook.
+
+    `embed_dim` and `input_dim` default to the shape of the checkpoint's
+    in_proj (the notebook's feat_dim: 84 for librispeech, 86 for paiia, 88
+    for paiib).
+    """
+    state = torch.load(path, map_location=map_location)
+    # DataParallel and torch.compile wrap the parameter names
+    for prefix in ('module.', '_orig_mod.'):
+        state = {k[len(prefix):] if k.startswith(prefix) else k: v for k, v in state.items()}
+    # in_proj is created even when forward skips it
+    checkpoint_embed_dim, checkpoint_input_dim = state['in_proj.weight'].shape
+    embed_dim = embed_dim or checkpoint_embed_dim
+    input_dim = input_dim or checkpoint_input_dim
+    model = GOPT(embed_dim=embed_dim, num_heads=num_heads, depth=depth, input_dim=input_dim)
+    model.load_state_dict(state)
+    return model.eval()
+
+
+@torch.no_grad()
+def score(model, feats, phns, lengths) -> List[dict]:
+    """Score a padded batch; `model` is a GOPT, a Scorer or a loaded TorchScript export.
+
+    Returns one dict per utterance: utt (5 scores), phn (one per phone) and
+    word (3 scores per phone). Utterance and word scores are on the 0-2
+    training scale (x5 for the original 0-10 range).
+    """
+    if isinstance(model, GOPT):
+        model = Scorer(model)
+    feats = torch.as_tensor(feats, dtype=torch.float)
+    phns = torch.as_tensor(phns)
+    lengths = torch.as_tensor(lengths)
+    utt, phn, word = model(feats, phns, lengths)
+    return [
+        {'utt': utt[i].tolist(), 'phn': phn[i, :n].tolist(), 'word': word[i, :n].tolist()}
+        for i, n in enumerate(lengths.tolist())
+    ]
+
+
+def export_torchscript(model: GOPT, path):
+    scripted = torch.jit.script(Scorer(model.eval()))
+    scripted.save(path)
+    return scripted
+
+
+def export_onnx(model: GOPT, path, opset_version=17):
+    # data-dependent trimming does not survive ONNX tracing, so only the GOPT
+    # forward is exported, with dynamic batch and length; the caller trims
+    # to the longest utterance and passes the key padding mask
+    model = model.eval()
+    feats = torch.zeros(2, 50, model.input_dim)
+    phns = torch.zeros(2, 50, dtype=torch.long)
+    key_padding_mask = torch.zeros(2, 50, dtype=torch.bool)
+    inputs = ['feats', 'phns', 'key_padding_mask']
+    names = ['u1', 'u2', 'u3', 'u4', 'u5', 'phn', 'w1', 'w2', 'w3']
+    dynamic_axes = {name: {0: 'batch', 1: 'length'} for name in inputs}
+    dynamic_axes.update({name: {0: 'batch'} for name in names[:5]})
+    dynamic_axes.update({name: {0: 'batch', 1: 'length'} for name in names[5:]})
+    torch.onnx.export(model, (feats, phns, key_padding_mask), path, input_names=inputs, output_names=names,
+                      dynamic_axes=dynamic_axes, opset_version=opset_version)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export a trained GOPT checkpoint")
+    parser.add_argument("checkpoint", help="best_audio_model.pth written by the notebook")
+    parser.add_argument("--embed_dim", type=int, help="default: read from the checkpoint")
+    parser.add_argument("--goptheads", type=int, default=1)
+    parser.add_argument("--goptdepth", type=int, default=3)
+    parser.add_argument("--input_dim", type=int, help="default: read from the checkpoint")
+    parser.add_argument("--torchscript", help="write a TorchScript Scorer here")
+    parser.add_argument("--onnx", help="write an ONNX model here")
+    args = parser.parse_args()
+
+    model = load(args.checkpoint, args.embed_dim, args.goptheads, args.goptdepth, args.input_dim)
+    if args.torchscript:
+        export_torchscript(model, args.torchscript)
+        print('TorchScript scorer written to ' + args.torchscript)
+    if args.onnx:
+        export_onnx(model, args.onnx)
+        print('ONNX model written to ' + args.onnx)
@@ -0,0 +1,120 @@
+import torch
+
+
+# Vectorized replacements for the valid_phn / valid_utt / valid_word loops of
+# GOPT_GPU.ipynb. Everything is computed on the device the predictions are on;
+# the results come back to the host in one transfer per call. Padded tokens
+# have a negative label (phones) or word id -1 (words), as in the GOPT data.
+
+
+def pcc(pred, target):
+    """Pearson correlation of each column of two [N, K] tensors."""
+    pred = pred - pred.mean(0)
+    target = target - target.mean(0)
+    return (pred * target).sum(0) / (pred.norm(dim=0) * target.norm(dim=0))
+
+
+def phn_stats(audio_output, target):
+    target = target.to(audio_output.device)
+    mask = target >= 0
+    pred = audio_output.squeeze(2)[mask].double()
+    target = target[mask].double()
+
+    mse = ((target - pred) ** 2).mean()
+    corr = pcc(pred[:, None], target[:, None])[0]
+    return torch.stack([mse, corr])
+
+
+def utt_stats(audio_output, target):
+    target = target.to(audio_output.device).double()
+    audio_output = audio_output.double()
+    mse = ((audio_output - target) ** 2).mean(0)
+    corr = pcc(audio_output, target)
+    return torch.cat([mse, corr])
+
+
+def valid_phn(audio_output, target):
+    mse, corr = phn_stats(audio_output, target).cpu().numpy()
+    return mse, corr
+
+
+def valid_utt(audio_output, target):
+    mse, corr = utt_stats(audio_output, target).cpu().numpy().reshape(2, -1)
+    return list(mse), list(corr)
+
+
+def word_segments(word_id):
+    """Word index of every token that belongs to a scored word, or -1.
+
+    Matches the original loop: a word is closed (and scored) when the word id
+    changes, scanning stops after the first padded token (id -1), and the
+    last word of an utterance that fills the whole sequence is never closed.
+    Unlike the loop, which started from id 0 and closed an empty word (a NaN
+    row) when the ids start at 1, the first word starts at the first token
+    whatever its id.
+    """
+    prev = torch.cat([word_id[:, :1], word_id[:, :-1]], dim=1)
+    before_pad = torch.cumprod(word_id != -1, dim=1).bool()
+    # positions up to and including the first padded token
+    scanned = torch.nn.functional.pad(before_pad[:, :-1], (1, 0), value=True)
+    change = (word_id != prev) & scanned
+
+    seg = torch.cumsum(change, dim=1)  # a change starts the next segment
+    closed = change.sum(1, keepdim=True)
+    keep = before_pad & (seg < closed)
+
+    offset = torch.cumsum(closed, dim=0) - closed
+    return torch.where(keep, seg + offset, -1), int(closed.sum())
+
+
+def word_stats(audio_output, target):
+    """MSE/PCC of the three word scores, plus the per-word predictions and targets."""
+    target = target.to(audio_output.device)
+    word_id = target[:, :, -1].int()
+    target = target[:, :, 0:3]
+
+    index, num_words = word_segments(word_id)
+    keep = index >= 0
+    index = index[keep]
+    count = torch.bincount(index, minlength=num_words).double()[:, None]
+
+    def segment_mean(x):
+        x = x[keep].double()
+        total = torch.zeros(num_words, x.shape[1], dtype=x.dtype, device=x.device).index_add_(0, index, x)
+        return (total / count).float()
+
+    valid_token_pred = segment_mean(audio_output)
+    valid_token_target = torch.round(segment_mean(target), decimals=2)
+
+    # the stress label is per word, so it should not vary inside one
+    stress = target[:, :, 1][keep]
+    lo = torch.full((num_words,), float('inf'), device=stress.device).scatter_reduce(0, index, stress, 'amin')
+    hi = torch.full((num_words,), float('-inf'), device=stress.device).scatter_reduce(0, index, stress, 'amax')
+    mixed = int((lo != hi).sum())
+    if mixed:
+        print('{:d} words have more than one stress label'.format(mixed))
+
+    pred, tgt = valid_token_pred.double(), valid_token_target.double()
+    mse = ((tgt - pred) ** 2).mean(0)
+    corr = pcc(pred, tgt)
+    return torch.cat([mse, corr]), valid_token_pred, valid_token_target
+
+
+def valid_word(audio_output, target):
+    stats, valid_token_pred, valid_token_target = word_stats(audio_output, target)
+    mse, corr = stats.cpu().numpy().reshape(2, -1)
+    return list(mse), list(corr), valid_token_pred.cpu().numpy(), valid_token_target.cpu().numpy()
+
+
+def evaluate(phn, phn_target, utt, utt_target, word, word_target):
+    """All phone, utterance and word metrics with a single device -> host copy.
+
+    Returns phn_mse, phn_corr, utt_mse, utt_corr, word_mse, word_corr and the
+    per-word predictions/targets, which stay on the device.
+    """
+    word, valid_word_pred, valid_word_target = word_stats(word, word_target)
+    stats = torch.cat([phn_stats(phn, phn_target), utt_stats(utt, utt_target), word]).cpu().numpy()
+    phn_mse, phn_corr = stats[:2]
+    utt_mse, utt_corr = stats[2:12].reshape(2, -1)
+    word_mse, word_corr = stats[12:].reshape(2, -1)
+    return phn_mse, phn_corr, list(utt_mse), list(utt_corr), list(word_mse), list(word_corr), valid_word_pred, valid_word_target
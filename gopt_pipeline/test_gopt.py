@@ -0,0 +1,26 @@
+import pytest
+import torch
+
+import gopt
+
+
+@pytest.mark.parametrize("input_dim, embed_dim", [(84, 24), (86, 24), (88, 32), (86, 86)])
+def test_load_reads_sizes_from_checkpoint(tmp_path, input_dim, embed_dim):
+    trained = gopt.GOPT(embed_dim=embed_dim, num_heads=1, depth=3, input_dim=input_dim)
+    path = tmp_path / "best_audio_model.pth"
+    # the notebook saves the DataParallel state dict
+    torch.save(torch.nn.DataParallel(trained).state_dict(), path)
+
+    model = gopt.load(path)
+    assert (model.input_dim, model.embed_dim) == (input_dim, embed_dim)
+    feats = torch.randn(2, 50, input_dim)
+    phns = torch.randint(0, 39, (2, 50))
+    for got, want in zip(model(feats, phns), trained.eval()(feats, phns)):
+        torch.testing.assert_close(got, want)
+
+
+def test_load_rejects_wrong_override(tmp_path):
+    path = tmp_path / "best_audio_model.pth"
+    torch.save(gopt.GOPT(embed_dim=24, num_heads=1, depth=3, input_dim=86).state_dict(), path)
+    with pytest.raises(RuntimeError):
+        gopt.load(path, input_dim=84)
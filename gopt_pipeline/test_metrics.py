@@ -0,0 +1,153 @@
+import numpy as np
+import pytest
+import torch
+
+import metrics
+
+
+# valid_phn / valid_utt / valid_word as they were in GOPT_GPU.ipynb, the
+# reference for the vectorized versions in metrics.py
+
+def loop_valid_phn(audio_output, target):
+    valid_token_pred = []
+    valid_token_target = []
+    audio_output = audio_output.squeeze(2)
+    for i in range(audio_output.shape[0]):
+        for j in range(audio_output.shape[1]):
+            if target[i, j] >= 0:
+                valid_token_pred.append(audio_output[i, j])
+                valid_token_target.append(target[i, j])
+    valid_token_target = np.array(valid_token_target)
+    valid_token_pred = np.array(valid_token_pred)
+
+    valid_token_mse = np.mean((valid_token_target - valid_token_pred) ** 2)
+    corr = np.corrcoef(valid_token_pred, valid_token_target)[0, 1]
+    return valid_token_mse, corr
+
+
+def loop_valid_utt(audio_output, target):
+    mse = []
+    corr = []
+    for i in range(5):
+        cur_mse = np.mean(((audio_output[:, i] - target[:, i]) ** 2).numpy())
+        cur_corr = np.corrcoef(audio_output[:, i], target[:, i])[0, 1]
+        mse.append(cur_mse)
+        corr.append(cur_corr)
+    return mse, corr
+
+
+def loop_valid_word(audio_output, target):
+    word_id = target[:, :, -1]
+    target = target[:, :, 0:3]
+
+    valid_token_pred = []
+    valid_token_target = []
+
+    for i in range(target.shape[0]):
+        prev_w_id = 0
+        start_id = 0
+        for j in range(target.shape[1]):
+            cur_w_id = word_id[i, j].int()
+            if cur_w_id != prev_w_id:
+                valid_token_pred.append(np.mean(audio_output[i, start_id: j, :].numpy(), axis=0))
+                valid_token_target.append(np.mean(target[i, start_id: j, :].numpy(), axis=0))
+                if cur_w_id == -1:
+                    break
+                else:
+                    prev_w_id = cur_w_id
+                    start_id = j
+
+    valid_token_pred = np.array(valid_token_pred)
+    valid_token_target = np.array(valid_token_target).round(2)
+
+    mse_list, corr_list = [], []
+    for i in range(3):
+        valid_token_mse = np.mean((valid_token_target[:, i] - valid_token_pred[:, i]) ** 2)
+        corr = np.corrcoef(valid_token_pred[:, i], valid_token_target[:, i])[0, 1]
+        mse_list.append(valid_token_mse)
+        corr_list.append(corr)
+    return mse_list, corr_list, valid_token_pred, valid_token_target
+
+
+def batch(seed, num_utt=40, seq_len=50, first_word_id=0):
+    """Predictions and targets shaped like the GOPT validation set: phones
+    padded with -1, word labels (accuracy, stress, total, word id) padded
+    with -1, and some utterances that fill the whole sequence."""
+    rng = np.random.default_rng(seed)
+    phn_target = np.full((num_utt, seq_len), -1.0, dtype=np.float32)
+    word_target = np.full((num_utt, seq_len, 4), -1.0, dtype=np.float32)
+    for i in range(num_utt):
+        length = seq_len if i % 5 == 0 else int(rng.integers(1, seq_len))
+        phn_target[i, :length] = rng.integers(0, 3, size=length) + rng.normal(0, 0.1, size=length)
+        j, word = 0, first_word_id
+        while j < length:
+            n = min(int(rng.integers(1, 8)), length - j)
+            word_target[i, j:j + n, 0] = rng.integers(0, 11) / 5
+            word_target[i, j:j + n, 1] = rng.integers(0, 2) * 2
+            word_target[i, j:j + n, 2] = word_target[i, j:j + n, 0] + rng.normal(0, 0.3, size=n)
+            word_target[i, j:j + n, 3] = word
+            j, word = j + n, word + 1
+
+    phn = torch.from_numpy(phn_target + rng.normal(0, 0.5, size=phn_target.shape).astype(np.float32))[:, :, None]
+    utt_target = torch.from_numpy(rng.uniform(0, 2, size=(num_utt, 5)).astype(np.float32))
+    utt = utt_target + torch.from_numpy(rng.normal(0, 0.4, size=(num_utt, 5)).astype(np.float32))
+    word = torch.from_numpy(word_target[:, :, :3] + rng.normal(0, 0.5, size=(num_utt, seq_len, 3)).astype(np.float32))
+    return phn, torch.from_numpy(phn_target), utt, utt_target, word, torch.from_numpy(word_target)
+
+
+# the loops accumulate in float32, metrics.py in float64
+TOLERANCE = dict(rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_valid_phn_matches_loop(seed):
+    phn, phn_target, *_ = batch(seed)
+    np.testing.assert_allclose(metrics.valid_phn(phn, phn_target), loop_valid_phn(phn, phn_target), **TOLERANCE)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_valid_utt_matches_loop(seed):
+    _, _, utt, utt_target, _, _ = batch(seed)
+    mse, corr = metrics.valid_utt(utt, utt_target)
+    loop_mse, loop_corr = loop_valid_utt(utt, utt_target)
+    np.testing.assert_allclose(mse, loop_mse, **TOLERANCE)
+    np.testing.assert_allclose(corr, loop_corr, **TOLERANCE)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_valid_word_matches_loop(seed):
+    *_, word, word_target = batch(seed)
+    mse, corr, pred, target = metrics.valid_word(word, word_target)
+    loop_mse, loop_corr, loop_pred, loop_target = loop_valid_word(word, word_target)
+    np.testing.assert_allclose(pred, loop_pred, **TOLERANCE)
+    np.testing.assert_array_equal(target, loop_target)
+    np.testing.assert_allclose(mse, loop_mse, **TOLERANCE)
+    np.testing.assert_allclose(corr, loop_corr, **TOLERANCE)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_valid_word_with_ids_from_one(seed):
+    # the loop closes an empty word in front of every utterance here and
+    # returns NaN; the ids themselves must not matter
+    *_, word, word_target = batch(seed)
+    shifted = word_target.clone()
+    shifted[:, :, 3] = torch.where(shifted[:, :, 3] >= 0, shifted[:, :, 3] + 1, shifted[:, :, 3])
+
+    mse, corr, pred, target = metrics.valid_word(word, shifted)
+    assert np.isfinite(mse).all() and np.isfinite(corr).all()
+    expected = metrics.valid_word(word, word_target)
+    for got, want in zip((mse, corr, pred, target), expected):
+        np.testing.assert_array_equal(got, want)
+
+
+def test_evaluate_matches_valid_functions():
+    phn, phn_target, utt, utt_target, word, word_target = batch(0)
+    phn_mse, phn_corr, utt_mse, utt_corr, word_mse, word_corr, word_pred, word_tgt = metrics.evaluate(
+        phn, phn_target, utt, utt_target, word, word_target
+    )
+    np.testing.assert_allclose([phn_mse, phn_corr], metrics.valid_phn(phn, phn_target))
+    np.testing.assert_allclose([utt_mse, utt_corr], metrics.valid_utt(utt, utt_target))
+    expected = metrics.valid_word(word, word_target)
+    np.testing.assert_allclose([word_mse, word_corr], expected[:2])
+    np.testing.assert_array_equal(word_pred.cpu().numpy(), expected[2])
+    np.testing.assert_array_equal(word_tgt.cpu().numpy(), expected[3])
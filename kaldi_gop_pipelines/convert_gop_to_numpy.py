@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+convert_gop_to_numpy.py ― Kaldi GOP features -> padded float32 .npy
+==================================================================
+Writes, for a prefix such as `tr` or `te`:
+
+    <prefix>_feat.npy      float32 [num_utts, max_len, feat_dim], zero padded
+    <prefix>_lengths.npy   int32   [num_utts], phones per utterance
+    <prefix>_utt_ids.npy   fixed-width unicode [num_utts], row -> utt id
+
+All three are plain arrays (no pickled objects), so they open with
+`np.load(..., mmap_mode='r')`; `<prefix>_feat.npy` has the layout
+GoPDataset reads as tr_feat.npy / te_feat.npy.
+
+With an .scp the matrices are read in parallel workers straight from their
+ark offsets into a memory-mapped output. With only an .ark the archive is
+streamed once and never held in memory.
+
+Quick start
+-----------
+    python convert_gop_to_numpy.py exp/s5_gop/feat.scp exp/s5_gop/ --prefix tr --workers 8
+    python convert_gop_to_numpy.py exp/s5_gop/gop.ark  exp/s5_gop/
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import kaldiio
+import numpy as np
+
+
+MAX_LEN = 50  # GOPT sequence length
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Convert Kaldi GOP features to padded .npy arrays")
+    p.add_argument("input", help="gop/feat .scp (parallel) or .ark (streamed)")
+    p.add_argument("output_dir")
+    p.add_argument("--prefix", default="gop", help="Output file prefix, e.g. tr or te")
+    p.add_argument("--max_len", type=int, default=MAX_LEN, help="Phones per utterance after padding/truncation")
+    p.add_argument("--workers", type=int, default=os.cpu_count(), help="Reader processes (.scp input only)")
+    return p.parse_args()
+
+
+def as_matrix(value) -> np.ndarray:
+    # gop.ark holds one score per phone, feat.ark one vector per phone
+    value = np.asarray(value, dtype=np.float32)
+    return value[:, None] if value.ndim == 1 else value
+
+
+def check_dim(utt_id: str, mat: np.ndarray, feat_dim: int) -> None:
+    # every row of <prefix>_feat.npy has the width of the first utterance
+    if mat.shape[1] != feat_dim:
+        raise ValueError(f"{utt_id}: {mat.shape[1]} features per phone, expected {feat_dim} like the first utterance")
+
+
+def pad(mat: np.ndarray, max_len: int) -> np.ndarray:
+    out = np.zeros((max_len, mat.shape[1]), dtype=np.float32)
+    n = min(len(mat), max_len)
+    out[:n] = mat[:n]
+    return out
+
+
+def save_index(output_dir, prefix, utt_ids, lengths, max_len):
+    # lengths count the rows actually stored in <prefix>_feat.npy
+    lengths = np.asarray(lengths, dtype=np.int32)
+    np.save(os.path.join(output_dir, f"{prefix}_lengths.npy"), np.minimum(lengths, max_len))
+    np.save(os.path.join(output_dir, f"{prefix}_utt_ids.npy"), np.asarray(utt_ids, dtype=str))
+    truncated = int((lengths > max_len).sum())
+    if truncated:
+        print(f"⚠️  {truncated} utterances longer than {max_len} phones were truncated")
+    print(f"{prefix}: {len(utt_ids)} utterances written to {output_dir}")
+
+
+# ── .scp: parallel random access ───────────────────────────────────────
+
+def read_scp(scp_path: str) -> list[tuple[str, str]]:
+    entries = []
+    with open(scp_path, encoding="utf-8") as f:
+        for line in f:
+            parts = line.strip().split(maxsplit=1)
+            if len(parts) == 2:
+                entries.append((parts[0], parts[1]))
+    return entries
+
+
+def convert_chunk(feat_path, start, entries, max_len):
+    feat = np.load(feat_path, mmap_mode="r+")
+    lengths = []
+    for i, (utt_id, rxspec) in enumerate(entries):
+        mat = as_matrix(kaldiio.load_mat(rxspec))
+        check_dim(utt_id, mat, feat.shape[2])
+        feat[start + i] = pad(mat, max_len)
+        lengths.append(len(mat))
+    feat.flush()
+    return lengths
+
+
+def convert_scp(scp_path, output_dir, prefix, max_len, workers):
+    entries = read_scp(scp_path)
+    if not entries:
+        raise SystemExit(f"No entries in {scp_path}")
+    utt_ids = [utt_id for utt_id, _ in entries]
+    feat_dim = as_matrix(kaldiio.load_mat(entries[0][1])).shape[1]
+
+    feat_path = os.path.join(output_dir, f"{prefix}_feat.npy")
+    tmp_path = os.path.join(output_dir, f".{prefix}_feat.npy.tmp")
+    np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(len(entries), max_len, feat_dim)).flush()
+
+    chunk = max(1, -(-len(entries) // (workers * 4)))
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [
+                pool.submit(convert_chunk, tmp_path, i, entries[i:i + chunk], max_len)
+                for i in range(0, len(entries), chunk)
+            ]
+            lengths = [n for future in futures for n in future.result()]
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    os.replace(tmp_path, feat_path)
+    save_index(output_dir, prefix, utt_ids, lengths, max_len)
+
+
+# ── .ark: one sequential pass ──────────────────────────────────────────
+
+def convert_ark(ark_path, output_dir, prefix, max_len):
+    # the row count is only known at the end, so padded rows go to a raw
+    # file first and the .npy header is prepended once the shape is known
+    raw_path = os.path.join(output_dir, f".{prefix}_feat.raw")
+    utt_ids, lengths, feat_dim = [], [], None
+    try:
+        with open(raw_path, "wb") as raw:
+            for utt_id, value in kaldiio.load_ark(ark_path):
+                mat = as_matrix(value)
+                if feat_dim is None:
+                    feat_dim = mat.shape[1]
+                check_dim(utt_id, mat, feat_dim)
+                raw.write(pad(mat, max_len).tobytes())
+                utt_ids.append(utt_id)
+                lengths.append(len(mat))
+    except BaseException:
+        os.remove(raw_path)
+        raise
+    if not utt_ids:
+        os.remove(raw_path)
+        raise SystemExit(f"No utterances in {ark_path}")
+
+    feat_path = os.path.join(output_dir, f"{prefix}_feat.npy")
+    tmp_path = os.path.join(output_dir, f".{prefix}_feat.npy.tmp")
+    header = {"descr": np.lib.format.dtype_to_descr(np.dtype(np.float32)),
+              "fortran_order": False, "shape": (len(utt_ids), max_len, feat_dim)}
+    with open(tmp_path, "wb") as out, open(raw_path, "rb") as raw:
+        np.lib.format.write_array_header_1_0(out, header)
+        shutil.copyfileobj(raw, out, 16 * 1024 * 1024)
+    os.replace(tmp_path, feat_path)
+    os.remove(raw_path)
+    save_index(output_dir, prefix, utt_ids, lengths, max_len)
+
+
+def main() -> None:
+    a = parse_args()
+    os.makedirs(a.output_dir, exist_ok=True)
+    if a.input.endswith(".scp"):
+        convert_scp(a.input, a.output_dir, a.prefix, a.max_len, a.workers)
+    else:
+        convert_ark(a.input, a.output_dir, a.prefix, a.max_len)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,14 @@
 #!/bin/bash
 . ./path.sh
 
-# Define your data dir
-data_root=/data/speechocean762
+# Corpus recorded with 1.build_corpus.py
+data_root=/data/basr18
 dest_dir=data/s5
+# 16 kHz WAVs that wav.scp points at, also the input of the MFA workflow
+mfa_dir=data/mfa_corpus
 
-# Generate Kaldi data directories
-python3 local/prepare_data.py $data_root $dest_dir || exit 1
+# Generate Kaldi data directories; re-runs only transcode new or changed recordings
+python3 "$(dirname "$0")/../4.export_corpus.py" $data_root --kaldi_dir $dest_dir --mfa_dir $mfa_dir || exit 1
 
 # Validate
 utils/validate_data_dir.sh --no-feats $dest_dir || exit 1
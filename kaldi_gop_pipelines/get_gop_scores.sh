@@ -6,3 +6,5 @@ local/get_gop.sh data/s5 data/lang exp/nnet2_tanh exp/s5_ali exp/s5_gop || exit
 
 # Export per-phone log-likelihoods to ark or numpy
 python3 local/convert_gop_to_numpy.py exp/s5_gop/gop.ark exp/s5_gop/
+# with an .scp the matrices are read in parallel, e.g. GOPT features:
+# python3 local/convert_gop_to_numpy.py exp/s5_gop/feat.scp exp/s5_gop/ --prefix tr --workers 8
@@ -0,0 +1,72 @@
+import importlib.util
+import json
+import sys
+import types
+from pathlib import Path
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+SCRIPT = Path(__file__).resolve().parent / "1.build_corpus.py"
+BLOCKS = 5
+BLOCK_FRAMES = 1600
+
+
+class FakeInputStream:
+    """Delivers BLOCKS blocks of audio to the callback as soon as it is opened."""
+
+    def __init__(self, samplerate=None, channels=None, dtype=None, callback=None):
+        self.callback = callback
+
+    def __enter__(self):
+        rng = np.random.default_rng(0)
+        for _ in range(BLOCKS):
+            self.callback(rng.uniform(-0.5, 0.5, (BLOCK_FRAMES, 1)).astype(np.float32), BLOCK_FRAMES, None, None)
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def build_corpus(monkeypatch, tmp_path):
+    # the real sounddevice needs PortAudio and a microphone
+    fake_sd = types.SimpleNamespace(InputStream=FakeInputStream, default=types.SimpleNamespace())
+    monkeypatch.setitem(sys.modules, "sounddevice", fake_sd)
+    spec = importlib.util.spec_from_file_location("build_corpus", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    monkeypatch.setattr(module, "CONFIG_PATH", tmp_path / "user_config.json")
+    monkeypatch.setattr(module, "RESOURCES_PATH", tmp_path / "resources.json")
+    (tmp_path / "user_config.json").write_text(json.dumps({"id": "86"}))
+    return module
+
+
+def test_record_mode_defaults_to_stream(build_corpus, monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["1.build_corpus.py"])
+    assert build_corpus.parse_args().record_mode == "stream"
+
+
+@pytest.mark.parametrize("mode", ["stream", "memory"])
+def test_main_records_and_keeps_one_take(build_corpus, monkeypatch, tmp_path, mode):
+    transcripts = tmp_path / "transcripts"
+    transcripts.mkdir()
+    (transcripts / "trans.1.txt").write_text("hello world\n")
+    out = tmp_path / "out"
+    monkeypatch.setattr(sys, "argv", ["1.build_corpus.py", "--transcripts_dir", str(transcripts),
+                                      "--out_dir", str(out), "--record_mode", mode])
+    # resource name, start recording, stop recording, keep
+    answers = iter(["a book", "", "", ""])
+    monkeypatch.setattr("builtins.input", lambda *args: next(answers))
+
+    build_corpus.main()
+
+    dest = out / "86" / "86001"
+    audio, sr = sf.read(dest / "86-086001-0001.flac")
+    assert sr == build_corpus.SR
+    assert len(audio) == BLOCKS * BLOCK_FRAMES
+    assert (dest / "transcript.txt").read_text() == "86-086001-0001 hello world\n"
+    assert not list(dest.glob(".*.part"))
+    assert next(answers, None) is None
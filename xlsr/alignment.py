@@ -0,0 +1,304 @@
+import numpy as np
+import torch
+from numba import njit
+
+
+# Same trellis/backtrack as the torchaudio forced alignment tutorial used in
+# GOP.align_phones, but with the whole frame loop compiled by numba.
+# Results match the torch implementation exactly, so `GOP.align_engine`
+# can switch between the two for checking.
+
+
+@njit(cache=True, nogil=True)
+def _fill_trellis(trellis, emission, tokens, blank_id):
+    num_frame, num_tokens = trellis.shape
+    for t in range(num_frame - 1):
+        p_stay = emission[t, blank_id]
+        for j in range(1, num_tokens):
+            # Score for staying at the same token
+            stayed = trellis[t, j] + p_stay
+            # Score for changing to the next token
+            changed = trellis[t, j - 1] + emission[t, tokens[j]]
+            trellis[t + 1, j] = changed if changed > stayed else stayed
+
+
+def get_trellis(emission, tokens, blank_id=0, open_end=False):
+    """`open_end` leaves the last frames free to end on any token, for
+    audio that is still being recorded (see best_end_token)."""
+    emission = np.ascontiguousarray(emission, dtype=np.float32)
+    tokens = np.asarray(tokens, dtype=np.int64)
+    num_frame = emission.shape[0]
+    num_tokens = len(tokens)
+
+    trellis = np.zeros((num_frame, num_tokens), dtype=np.float32)
+    # torch.cumsum accumulates float32 in double on CPU, do the same here
+    trellis[1:, 0] = np.cumsum(emission[1:, blank_id], dtype=np.float64)
+    trellis[0, 1:] = -np.inf
+    if not open_end:
+        trellis[-num_tokens + 1 :, 0] = np.inf
+
+    _fill_trellis(trellis, emission, tokens, blank_id)
+    return trellis
+
+
+@njit(cache=True, nogil=True)
+def _backtrack(trellis, emission, tokens, blank_id, end_token):
+    num_frame = trellis.shape[0]
+    token_index = np.zeros(num_frame, dtype=np.int64)
+    # Raw emission value picked at every frame; exp() is applied by the caller
+    picked = np.empty(num_frame, dtype=np.float32)
+
+    t, j = num_frame - 1, end_token
+    token_index[t] = j
+    picked[t] = emission[t, blank_id]
+    while j > 0:
+        # Should not happen but just in case
+        assert t > 0
+
+        p_stay = emission[t - 1, blank_id]
+        p_change = emission[t - 1, tokens[j]]
+        stayed = trellis[t - 1, j] + p_stay
+        changed = trellis[t - 1, j - 1] + p_change
+
+        t -= 1
+        if changed > stayed:
+            j -= 1
+            picked[t] = p_change
+        else:
+            picked[t] = p_stay
+        token_index[t] = j
+
+    # Now j == 0, the remaining frames belong to the first token
+    while t > 0:
+        picked[t - 1] = emission[t - 1, blank_id]
+        t -= 1
+
+    return token_index, picked
+
+
+def backtrack(trellis, emission, tokens, blank_id=0, end_token=None):
+    """Return (token_index, score) per frame, one entry for every frame of the path.
+
+    The path ends on the last token unless `end_token` says otherwise.
+    """
+    emission = np.ascontiguousarray(emission, dtype=np.float32)
+    tokens = np.asarray(tokens, dtype=np.int64)
+    if end_token is None:
+        end_token = len(tokens) - 1
+    token_index, picked = _backtrack(trellis, emission, tokens, blank_id, end_token)
+    # torch's exp, so the scores are bit-identical to the torch engine
+    return token_index, torch.from_numpy(picked).exp().numpy()
+
+
+@njit(cache=True, nogil=True)
+def _fill_decisions(emission, tokens, blank_id, first_column, lo, hi, offsets, bits):
+    # Same recurrence as _fill_trellis, row by row over [lo[t], hi[t]) with
+    # cells outside the band at -inf; only "changed > stayed" is kept, one bit
+    # per cell, which is all the backtrack needs.
+    num_tokens = len(tokens)
+    prev = np.full(num_tokens, -np.inf, dtype=np.float32)
+    cur = np.full(num_tokens, -np.inf, dtype=np.float32)
+    prev[0] = 0.0
+    num_frame = emission.shape[0]
+    for t in range(num_frame - 1):
+        p_stay = emission[t, blank_id]
+        for j in range(lo[t + 1], hi[t + 1]):
+            if j == 0:
+                cur[0] = first_column[t + 1]
+                continue
+            stayed = prev[j] + p_stay if lo[t] <= j < hi[t] else np.float32(-np.inf)
+            changed = prev[j - 1] + emission[t, tokens[j]] if lo[t] <= j - 1 < hi[t] else np.float32(-np.inf)
+            if changed > stayed:
+                cur[j] = changed
+                k = offsets[t + 1] + j - lo[t + 1]
+                bits[k >> 3] |= np.uint8(1 << (k & 7))
+            else:
+                cur[j] = stayed
+        prev, cur = cur, prev
+    return prev
+
+
+@njit(cache=True, nogil=True)
+def _backtrack_decisions(emission, tokens, blank_id, lo, offsets, bits, end_token):
+    num_frame = emission.shape[0]
+    token_index = np.zeros(num_frame, dtype=np.int64)
+    picked = np.empty(num_frame, dtype=np.float32)
+    # whether the path ran along the edge of the band somewhere
+    touched = False
+
+    t, j = num_frame - 1, end_token
+    token_index[t] = j
+    picked[t] = emission[t, blank_id]
+    while j > 0:
+        assert t > 0
+        k = offsets[t] + j - lo[t]
+        changed = (bits[k >> 3] >> (k & 7)) & 1
+        t -= 1
+        if changed:
+            picked[t] = emission[t, tokens[j]]
+            j -= 1
+        else:
+            picked[t] = emission[t, blank_id]
+        token_index[t] = j
+        if j == lo[t] and j > 0:
+            touched = True
+
+    while t > 0:
+        picked[t - 1] = emission[t - 1, blank_id]
+        t -= 1
+
+    return token_index, picked, touched
+
+
+class Decisions:
+    """Stay/change bits of a (possibly banded) trellis, from fill_decisions."""
+
+    def __init__(self, lo, hi, offsets, bits, last_row, band):
+        self.lo, self.hi, self.offsets, self.bits = lo, hi, offsets, bits
+        self.last_row = last_row
+        self.band = band
+
+    @property
+    def nbytes(self):
+        return self.lo.nbytes + self.hi.nbytes + self.offsets.nbytes + self.bits.nbytes + self.last_row.nbytes
+
+
+def band_limits(emission, num_tokens, band, blank_id=0, open_end=False):
+    """[lo, hi) token range of every frame: `band` tokens either side of where
+    the greedy path is, scaled to the transcript length unless `open_end`."""
+    num_frame = emission.shape[0]
+    if band is None or 2 * band + 1 >= num_tokens:
+        return np.zeros(num_frame, dtype=np.int64), np.full(num_frame, num_tokens, dtype=np.int64)
+    ids = emission.argmax(-1)
+    entered = (ids != blank_id) & (ids != np.concatenate(([blank_id], ids[:-1])))
+    center = np.cumsum(entered).astype(np.float64)
+    if not open_end and center[-1] > 0:
+        center *= (num_tokens - 1) / center[-1]
+    center = center.astype(np.int64)
+    lo = np.clip(center - band, 0, num_tokens - 1)
+    hi = np.clip(center + band + 1, 1, num_tokens)
+    lo[0] = 0
+    if not open_end:
+        hi[-1] = num_tokens
+    return lo, hi
+
+
+def fill_decisions(emission, tokens, blank_id=0, band=None, open_end=False):
+    """get_trellis without the trellis: one bit per cell instead of a float32,
+    and with `band` only the cells near the greedy path, so memory grows with
+    frames x band instead of frames x tokens."""
+    emission = np.ascontiguousarray(emission, dtype=np.float32)
+    tokens = np.asarray(tokens, dtype=np.int64)
+    num_frame = emission.shape[0]
+    num_tokens = len(tokens)
+
+    # column 0 exactly as get_trellis sets it
+    first_column = np.zeros(num_frame, dtype=np.float32)
+    first_column[1:] = np.cumsum(emission[1:, blank_id], dtype=np.float64)
+    if not open_end:
+        first_column[-num_tokens + 1 :] = np.inf
+
+    lo, hi = band_limits(emission, num_tokens, band, blank_id, open_end)
+    widths = np.maximum(hi - lo, 0)
+    offsets = np.concatenate(([0], np.cumsum(widths)[:-1])).astype(np.int64)
+    bits = np.zeros((int(widths.sum()) + 7) // 8, dtype=np.uint8)
+    last_row = _fill_decisions(emission, tokens, blank_id, first_column, lo, hi, offsets, bits)
+    return Decisions(lo, hi, offsets, bits, last_row, band)
+
+
+def backtrack_decisions(decisions, emission, tokens, blank_id=0, end_token=None):
+    """backtrack() for fill_decisions; also returns whether the path ran along
+    the lower edge of the band, where a wider band might find a better one."""
+    emission = np.ascontiguousarray(emission, dtype=np.float32)
+    tokens = np.asarray(tokens, dtype=np.int64)
+    if end_token is None:
+        end_token = len(tokens) - 1
+    token_index, picked, touched = _backtrack_decisions(
+        emission, tokens, blank_id, decisions.lo, decisions.offsets, decisions.bits, end_token
+    )
+    touched = touched or bool(np.any((token_index == decisions.hi - 1) & (token_index < len(tokens) - 1)))
+    return token_index, torch.from_numpy(picked).exp().numpy(), touched
+
+
+def align_path(emission, tokens, blank_id=0, band=None):
+    """backtrack(get_trellis(...)) with one bit per trellis cell.
+
+    Without `band` the path is the same. With it, only paths within `band`
+    tokens of the greedy path's progress are searched, and the band is doubled
+    while the best of them runs along its edge; that finds the same path on
+    peaky CTC emissions, but a better path that leaves the band and comes
+    back can still be missed.
+    """
+    while True:
+        decisions = fill_decisions(emission, tokens, blank_id, band)
+        # the last token can be out of reach of a narrow band
+        if band is not None and decisions.last_row[-1] == -np.inf:
+            touched = True
+        else:
+            token_index, scores, touched = backtrack_decisions(decisions, emission, tokens, blank_id)
+        if not touched or band is None:
+            return token_index, scores
+        band = None if 4 * band + 1 >= len(tokens) else 2 * band
+
+
+def best_end_token(trellis):
+    """Token the best path through an open-ended trellis has reached at the last frame."""
+    return int(np.argmax(trellis[-1]))
+
+
+@njit(cache=True, nogil=True)
+def _merge_runs(token_index, scores):
+    num_frame = len(token_index)
+    starts = np.empty(num_frame, dtype=np.int64)
+    ends = np.empty(num_frame, dtype=np.int64)
+    means = np.empty(num_frame, dtype=np.float64)
+
+    n = 0
+    i1 = 0
+    while i1 < num_frame:
+        i2 = i1
+        total = 0.0
+        while i2 < num_frame and token_index[i2] == token_index[i1]:
+            total += np.float64(scores[i2])
+            i2 += 1
+        starts[n] = i1
+        ends[n] = i2
+        means[n] = total / (i2 - i1)
+        n += 1
+        i1 = i2
+    return starts[:n], ends[:n], means[:n]
+
+
+def merge_runs(token_index, scores):
+    """Collapse a per-frame path into runs: (start_frame, end_frame, mean_score) arrays."""
+    return _merge_runs(np.asarray(token_index, dtype=np.int64), np.asarray(scores, dtype=np.float32))
+
+
+def greedy_segments(emission, blank_id=0):
+    """Frame spans of the CTC greedy path, one span per non-blank frame.
+
+    Mirrors what the trellis does with the frame-level argmax sequence: a
+    token is entered on the frame after its emission and keeps the blank
+    frames that follow, and the first token starts at frame 0. Segments can
+    differ in two places only: the last token or two, where the trellis is
+    pinned to the final frame, and the boundaries inside a run of repeats
+    of the first token (the trellis never scores token 0's own emission, so
+    any frame of that run can be the one it leaves to the blank).
+    test_alignment.py checks this. Returns (start_frame, end_frame,
+    mean_score) arrays.
+    """
+    emission = np.asarray(emission, dtype=np.float32)
+    num_frame = emission.shape[0]
+    ids = emission.argmax(-1)
+    frames = np.flatnonzero(ids != blank_id)
+    if len(frames) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float64)
+
+    starts = np.minimum(frames + 1, num_frame - 1)
+    starts[0] = 0
+    ends = np.append(starts[1:], num_frame)
+    picked = emission[np.arange(num_frame), ids]
+    scores = torch.from_numpy(picked).exp().numpy().astype(np.float64)
+    means = np.add.reduceat(scores, starts) / np.maximum(ends - starts, 1)
+    return starts, ends, means
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+alignment_store.py ― MFA TextGrids as a precomputed alignment source
+===================================================================
+* Parses every <utt_id>.TextGrid under an MFA output directory (long or
+  short TextGrid format) in a process pool.
+* Writes the phone and word tiers as flat arrays: start/end seconds and an
+  index into the phone/word inventory, with per-utterance offsets. utt_ids
+  are sorted, so a lookup is a binary search, and every array is an .npy
+  file opened memory-mapped.
+* GOP.canonical_segments turns an utterance back into Segments, so scoring
+  can skip the canonical trellis (score_corpus.py --alignments).
+
+Silence intervals ("", "sil", "sp") are dropped; MFA's "spn" (spoken noise,
+out-of-vocabulary words) is kept so every word keeps its phones. MFA phone
+sets differ from the model's espeak phones, --phone_map translates them.
+
+Quick start
+-----------
+    python alignment_store.py mfa_output/ --out alignments/ --workers 8
+    python alignment_store.py mfa_output/ --out alignments/ --phone_map mfa_to_espeak.tsv
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+
+SILENCE = {"", "sil", "sp"}
+INVENTORY_FILE = "inventory.json"
+# item [1]:, intervals [3]: ... carry indices that are not values
+_INDEX = re.compile(r"\[\d*\]")
+_TOKEN = re.compile(r'"((?:[^"]|"")*)"|(-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)')
+
+
+def read_textgrid(path) -> dict:
+    """{tier name: [(xmin, xmax, text), ...]} of the interval tiers of a TextGrid.
+
+    Long and short files hold the same values in the same order, so both are
+    read as one stream of numbers and quoted strings.
+    """
+    with open(path, encoding="utf-8-sig") as f:
+        text = _INDEX.sub("", f.read())
+    tokens = [s.replace('""', '"') if n == "" else float(n) for s, n in _TOKEN.findall(text)]
+
+    # "ooTextFile" "TextGrid" xmin xmax size
+    i = 5
+    tiers = {}
+    for _ in range(int(tokens[4])):
+        tier_class, name, count = tokens[i], tokens[i + 1], int(tokens[i + 4])
+        i += 5
+        if tier_class == "IntervalTier":
+            tiers[name] = [(tokens[i + 3 * k], tokens[i + 3 * k + 1], tokens[i + 3 * k + 2]) for k in range(count)]
+            i += 3 * count
+        else:  # TextTier: time and mark
+            i += 2 * count
+    return tiers
+
+
+def find_tier(tiers: dict, kind: str) -> list:
+    # "phones", or "<speaker> - phones" when MFA aligned several speakers
+    for name, intervals in tiers.items():
+        if name == kind or name.endswith(f" - {kind}"):
+            return intervals
+    raise KeyError(f"no {kind} tier")
+
+
+def parse_utterance(path, phone_map=None):
+    """(utt_id, phones, words) with silences dropped; each word carries the
+    [first, last) range of the phones whose midpoint falls inside it."""
+    tiers = read_textgrid(path)
+    phones = [
+        (start, end, phone_map.get(label, label) if phone_map else label)
+        for start, end, label in find_tier(tiers, "phones")
+        if label not in SILENCE
+    ]
+    mids = np.array([(start + end) / 2 for start, end, _ in phones])
+    words = []
+    for start, end, label in find_tier(tiers, "words"):
+        if label in SILENCE:
+            continue
+        first, last = np.searchsorted(mids, [start, end])
+        words.append((start, end, label, int(first), int(last)))
+    return Path(path).stem, phones, words
+
+
+def _parse_many(paths, phone_map):
+    parsed, failed = [], []
+    for path in paths:
+        try:
+            parsed.append(parse_utterance(path, phone_map))
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            failed.append((str(path), repr(e)))
+    return parsed, failed
+
+
+def build(textgrid_dir, out_dir, workers=None, phone_map=None, chunk=256):
+    """Parse every TextGrid under `textgrid_dir` into an AlignmentStore at `out_dir`."""
+    paths = sorted(Path(textgrid_dir).rglob("*.TextGrid"))
+    chunks = [paths[i : i + chunk] for i in range(0, len(paths), chunk)]
+    utterances, failed = [], []
+    with ProcessPoolExecutor(workers) as pool:
+        for parsed, bad in pool.map(_parse_many, chunks, [phone_map] * len(chunks)):
+            utterances += parsed
+            failed += bad
+    for path, error in failed:
+        print(f"⚠️  skipped {path}: {error}")
+
+    utterances.sort(key=lambda u: u[0])
+    ids = [u[0] for u in utterances]
+    duplicates = {i for i, j in zip(ids, ids[1:]) if i == j}
+    if duplicates:
+        raise ValueError(f"utterance ids found in more than one TextGrid: {sorted(duplicates)[:5]}")
+
+    phone_inventory = sorted({label for _, phones, _ in utterances for _, _, label in phones})
+    word_inventory = sorted({label for _, _, words in utterances for _, _, label, _, _ in words})
+    phone_index = {p: i for i, p in enumerate(phone_inventory)}
+    word_index = {w: i for i, w in enumerate(word_inventory)}
+
+    def offsets(counts):
+        return np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+    phones = [p for _, utt_phones, _ in utterances for p in utt_phones]
+    words = [w for _, _, utt_words in utterances for w in utt_words]
+    arrays = {
+        "utt_ids": np.array(ids, dtype=f"U{max([len(i) for i in ids] + [1])}"),
+        "phone_offsets": offsets([len(u[1]) for u in utterances]),
+        "phone_start": np.array([p[0] for p in phones], dtype=np.float64),
+        "phone_end": np.array([p[1] for p in phones], dtype=np.float64),
+        "phone_label": np.array([phone_index[p[2]] for p in phones], dtype=np.int32),
+        "word_offsets": offsets([len(u[2]) for u in utterances]),
+        "word_start": np.array([w[0] for w in words], dtype=np.float64),
+        "word_end": np.array([w[1] for w in words], dtype=np.float64),
+        "word_label": np.array([word_index[w[2]] for w in words], dtype=np.int32),
+        # relative to the utterance's first phone
+        "word_phone_first": np.array([w[3] for w in words], dtype=np.int32),
+        "word_phone_last": np.array([w[4] for w in words], dtype=np.int32),
+    }
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), array)
+    with open(os.path.join(out_dir, INVENTORY_FILE), "w", encoding="utf-8") as f:
+        json.dump({"phones": phone_inventory, "words": word_inventory}, f, ensure_ascii=False)
+    print(f"{len(ids)} utterances, {len(phones)} phones, {len(words)} words written to {out_dir}")
+    return len(ids)
+
+
+class AlignmentStore:
+    """Read side of `build`; arrays are memory-mapped, so opening is cheap and
+    worker processes share the pages."""
+
+    def __init__(self, path, mmap=True):
+        self.path = path
+        mode = "r" if mmap else None
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+        self.utt_ids = load("utt_ids")
+        self.phone_offsets = load("phone_offsets")
+        self.phone_start = load("phone_start")
+        self.phone_end = load("phone_end")
+        self.phone_label = load("phone_label")
+        self.word_offsets = load("word_offsets")
+        self.word_start = load("word_start")
+        self.word_end = load("word_end")
+        self.word_label = load("word_label")
+        self.word_phone_first = load("word_phone_first")
+        self.word_phone_last = load("word_phone_last")
+        with open(os.path.join(path, INVENTORY_FILE), encoding="utf-8") as f:
+            inventory = json.load(f)
+        self.phone_inventory = inventory["phones"]
+        self.word_inventory = inventory["words"]
+
+    def __len__(self):
+        return len(self.utt_ids)
+
+    def index(self, utt_id):
+        """Row of `utt_id`, or None."""
+        i = int(np.searchsorted(self.utt_ids, utt_id))
+        if i < len(self.utt_ids) and self.utt_ids[i] == utt_id:
+            return i
+        return None
+
+    def __contains__(self, utt_id):
+        return self.index(utt_id) is not None
+
+    def phones(self, utt_id):
+        """(labels, start seconds, end seconds) of the utterance's phones."""
+        i = self._require(utt_id)
+        lo, hi = self.phone_offsets[i], self.phone_offsets[i + 1]
+        labels = [self.phone_inventory[k] for k in self.phone_label[lo:hi]]
+        return labels, np.asarray(self.phone_start[lo:hi]), np.asarray(self.phone_end[lo:hi])
+
+    def words(self, utt_id):
+        """(words, [first, last) phone range of every word)."""
+        i = self._require(utt_id)
+        lo, hi = self.word_offsets[i], self.word_offsets[i + 1]
+        words = [self.word_inventory[k] for k in self.word_label[lo:hi]]
+        word_pos = [[int(a), int(b)] for a, b in zip(self.word_phone_first[lo:hi], self.word_phone_last[lo:hi])]
+        return words, word_pos
+
+    def _require(self, utt_id):
+        i = self.index(utt_id)
+        if i is None:
+            raise KeyError(utt_id)
+        return i
+
+
+def read_phone_map(path):
+    """Two tab- or space-separated columns: MFA phone, model phone."""
+    mapping = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 2:
+                mapping[parts[0]] = parts[1]
+    return mapping
+
+
+def main():
+    p = argparse.ArgumentParser(description="Index MFA TextGrids for GOP scoring")
+    p.add_argument("textgrids", help="MFA output directory")
+    p.add_argument("--out", default="alignments", help="Store directory")
+    p.add_argument("--workers", type=int, default=os.cpu_count())
+    p.add_argument("--phone_map", help="MFA phone -> model phone, one pair per line")
+    a = p.parse_args()
+    build(a.textgrids, a.out, a.workers, read_phone_map(a.phone_map) if a.phone_map else None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+benchmark.py ― latency of the GOP pipeline, per stage and over HTTP
+==================================================================
+Generates synthetic clips (1–60 s) with transcripts (5–100 words) and runs
+them through GOP.forward, timing every stage through GOP.on_stage:
+load_resample, processor, forward, phonemize, trellis, backtrack (greedy)
+and scoring. With --concurrency the FastAPI app in main.py is also driven
+in-process (httpx + ASGI transport, lifespan included) by that many
+concurrent clients.
+
+Results (p50/p95/p99 per stage, peak RSS, requests/s) are written as JSON;
+pass a previous result as --baseline to print the change per stage.
+
+--memory measures, for every --memory_lengths clip, the peak RSS of one
+GOP.forward in a fresh process, once scoring the whole clip at once and once
+with chunked wav2vec2 windows and the banded trellis (GOP.chunk_sec,
+align_engine="banded"), and the MB each extra second of audio costs between
+consecutive lengths: roughly constant while memory grows linearly with the
+clip, rising with the length when something grows with its square.
+
+Quick start
+-----------
+    python benchmark.py --out bench.json
+    python benchmark.py --out new.json --baseline bench.json --concurrency 1 8
+    python benchmark.py --memory --memory_lengths 30 60 120 180 600 --cases 1:5 --memory_slope_ratio 2
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import multiprocessing
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import soundfile as sf
+import torch
+
+import model_registry
+import phonemes
+from gop_scores import GOP
+
+
+# (seconds, words); long clips get long prompts, as in real use
+DEFAULT_CASES = ["1:5", "5:15", "15:40", "30:70", "60:100"]
+# speaking rate of the --memory clips
+WORDS_PER_SECOND = 2.5
+# uploads are usually 44.1/48 kHz, so the benchmark resamples too
+SAMPLE_RATE = 44_100
+WORDS = (
+    "the quick brown fox jumps over lazy dog she sells sea shells by shore "
+    "rain pours down heavily lightning flashes brightly trees sway wildly "
+    "streets flood quickly people stay indoors windows rattle hard today "
+    "morning evening water music river garden window yellow purple little"
+).split()
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark GOP scoring per stage and over HTTP")
+    p.add_argument("--cases", nargs="+", default=DEFAULT_CASES, help="seconds:words pairs")
+    p.add_argument("--repeats", type=int, default=5, help="timed runs per case")
+    p.add_argument("--warmup", type=int, default=1, help="untimed runs per case")
+    p.add_argument("--model_dir", default=model_registry.MODEL_DIR)
+    p.add_argument("--device", default=None)
+    p.add_argument("--compile", action="store_true")
+    p.add_argument("--quantize", action="store_true")
+    p.add_argument("--concurrency", type=int, nargs="*", default=[],
+                   help="also call POST /upload-audio in-process with this many concurrent clients")
+    p.add_argument("--requests", type=int, default=32, help="HTTP requests per concurrency level")
+    p.add_argument("--memory", action="store_true", help="peak RSS against clip length, whole vs chunked")
+    p.add_argument("--memory_lengths", type=float, nargs="+", default=[30, 60, 120, 180, 600], help="seconds")
+    p.add_argument("--memory_slope_ratio", type=float, default=None,
+                   help="exit 1 if the chunked mode's MB per extra second between the two longest clips "
+                        "is more than this many times that between the two shortest (e.g. 2)")
+    p.add_argument("--chunk_sec", type=float, default=20.0, help="window of the chunked --memory mode")
+    p.add_argument("--trellis_band", type=int, default=GOP.trellis_band)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", default="benchmark.json")
+    p.add_argument("--baseline", help="earlier benchmark JSON to compare against")
+    p.add_argument("--fail_above", type=float, default=None,
+                   help="exit 1 if any p50 is more than this fraction slower than the baseline (e.g. 0.1)")
+    return p.parse_args()
+
+
+# ── synthetic inputs ───────────────────────────────────────────────────
+
+def synthetic_wav(seconds: float, rng: np.random.Generator) -> bytes:
+    """Voiced-sounding noise: a few harmonics with a wandering pitch, syllable-rate
+    amplitude modulation and background noise, encoded as a 16-bit WAV."""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = 120 + 30 * np.sin(2 * np.pi * 0.3 * t + rng.uniform(0, 2 * np.pi))
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t + rng.uniform(0, 2 * np.pi)) ** 2
+    audio = 0.3 * voice * envelope + 0.01 * rng.standard_normal(len(t))
+    buffer = io.BytesIO()
+    sf.write(buffer, (audio / np.abs(audio).max() * 0.9).astype(np.float32), SAMPLE_RATE, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+def synthetic_transcript(words: int, rng: np.random.Generator) -> str:
+    return " ".join(rng.choice(WORDS, size=words))
+
+
+def make_cases(specs, seed):
+    rng = np.random.default_rng(seed)
+    cases = []
+    for spec in specs:
+        seconds, words = spec.split(":")
+        cases.append({
+            "name": spec,
+            "seconds": float(seconds),
+            "words": int(words),
+            "audio": synthetic_wav(float(seconds), rng),
+            "transcript": synthetic_transcript(int(words), rng),
+        })
+    return cases
+
+
+# ── statistics ─────────────────────────────────────────────────────────
+
+def summarize(samples) -> dict:
+    samples = np.asarray(samples) * 1000
+    return {
+        "n": int(len(samples)),
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+    }
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024**2 if sys.platform == "darwin" else rss / 1024
+
+
+# ── in-process stage timing ────────────────────────────────────────────
+
+def run_stages(gop: GOP, cases, repeats: int, warmup: int) -> dict:
+    results = {}
+    for case in cases:
+        timings = defaultdict(list)
+        for run in range(warmup + repeats):
+            current = defaultdict(float)
+            gop.on_stage = lambda stage, seconds: current.__setitem__(stage, current[stage] + seconds)
+            start = time.perf_counter()
+            gop.forward(io.BytesIO(case["audio"]), case["transcript"])
+            total = time.perf_counter() - start
+            if run >= warmup:
+                for stage, seconds in current.items():
+                    timings[stage].append(seconds)
+                timings["total"].append(total)
+        gop.on_stage = None
+
+        results[case["name"]] = {
+            "seconds": case["seconds"],
+            "words": case["words"],
+            "stages": {stage: summarize(samples) for stage, samples in timings.items()},
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        print(f"{case['name']:>8}  total p50 {results[case['name']]['stages']['total']['p50_ms']:9.1f} ms  "
+              + "  ".join(f"{stage} {s['p50_ms']:.1f}" for stage, s in results[case["name"]]["stages"].items() if stage != "total"))
+    return results
+
+
+# ── peak memory against clip length ─────────────────────────────────────
+
+def reset_peak_rss() -> None:
+    # Linux resets VmHWM on "5"; elsewhere the peak still includes model loading
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def proc_status_mb(field: str) -> float | None:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def memory_run(seconds: float, mode: str, a: argparse.Namespace) -> dict:
+    """One GOP.forward on a fresh clip; runs in its own process."""
+    loaded = model_registry.load(a.model_dir, device=a.device, quantize=a.quantize)
+    gop = GOP(loaded.model, loaded.processor, loaded.device, phoneme_cache=phonemes.PhonemeCache(max_size=0),
+              model_id=loaded.checkpoint_id)
+    if mode == "chunked":
+        gop.chunk_sec = a.chunk_sec
+        gop.align_engine = "banded"
+        gop.trellis_band = a.trellis_band
+    case = make_cases([f"{seconds:g}:{max(5, round(seconds * WORDS_PER_SECOND))}"], a.seed)[0]
+
+    reset_peak_rss()
+    before = proc_status_mb("VmRSS") or peak_rss_mb()
+    start = time.perf_counter()
+    gop.forward(io.BytesIO(case["audio"]), case["transcript"])
+    elapsed = time.perf_counter() - start
+    peak = proc_status_mb("VmHWM") or peak_rss_mb()
+    return {"rss_before_mb": before, "peak_rss_mb": peak, "growth_mb": peak - before, "latency_ms": 1000 * elapsed}
+
+
+def run_memory(a: argparse.Namespace) -> dict:
+    results = {}
+    for mode in ("whole", "chunked"):
+        results[mode] = {}
+        for seconds in a.memory_lengths:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                try:
+                    entry = pool.submit(memory_run, seconds, mode, a).result()
+                except Exception as e:  # the whole-clip mode is the one expected to run out of memory
+                    entry = {"error": repr(e)}
+            results[mode][f"{seconds:g}"] = entry
+            if "error" in entry:
+                print(f"{mode:>8} {seconds:6.0f} s  failed: {entry['error']}")
+            else:
+                print(f"{mode:>8} {seconds:6.0f} s  peak RSS {entry['peak_rss_mb']:8.0f} MB "
+                      f"(+{entry['growth_mb']:.0f} MB over the loaded model), {entry['latency_ms']:.0f} ms")
+    for mode, entries in results.items():
+        slopes = memory_slopes(entries)
+        if slopes:
+            print(f"{mode:>8} MB per extra second: " + ", ".join(
+                f"{s['from']}-{s['to']} s {s['mb_per_second']:.2f}" for s in slopes))
+    return results
+
+
+def memory_slopes(entries: dict) -> list:
+    """Peak RSS growth per added second of audio between consecutive clip lengths."""
+    ok = sorted((float(seconds), entry["growth_mb"]) for seconds, entry in entries.items() if "growth_mb" in entry)
+    return [
+        {"from": f"{s0:g}", "to": f"{s1:g}", "mb_per_second": (g1 - g0) / (s1 - s0)}
+        for (s0, g0), (s1, g1) in zip(ok, ok[1:])
+    ]
+
+
+# ── in-process HTTP load ───────────────────────────────────────────────
+
+async def run_http(cases, levels, requests_per_level, a) -> dict:
+    import httpx
+
+    # every request must reach the model, not the emission cache
+    os.environ["XLSR_EMISSION_CACHE_MB"] = "0"
+    os.environ.pop("XLSR_EMISSION_CACHE_DIR", None)
+    import main
+
+    # the app loads the same model as the stage benchmark (model_registry
+    # hands back the already loaded one)
+    main.MODEL_DIR = a.model_dir
+    main.DEVICE = a.device
+    main.COMPILE = a.compile
+    main.QUANTIZE = a.quantize
+
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        async with main.lifespan(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                for level in levels:
+                    latencies, errors = [], 0
+                    queue = asyncio.Queue()
+                    for i in range(requests_per_level):
+                        queue.put_nowait(cases[i % len(cases)])
+
+                    async def worker():
+                        nonlocal errors
+                        while not queue.empty():
+                            case = queue.get_nowait()
+                            start = time.perf_counter()
+                            response = await client.post(
+                                "/upload-audio",
+                                files={"audio": ("bench.wav", case["audio"], "audio/wav")},
+                                data={"transcript": case["transcript"]},
+                            )
+                            latencies.append(time.perf_counter() - start)
+                            errors += response.status_code != 200
+
+                    start = time.perf_counter()
+                    await asyncio.gather(*(worker() for _ in range(level)))
+                    elapsed = time.perf_counter() - start
+                    results[str(level)] = {
+                        "latency": summarize(latencies),
+                        "requests_per_sec": len(latencies) / elapsed,
+                        "errors": errors,
+                        "peak_rss_mb": peak_rss_mb(),
+                    }
+                    print(f"concurrency {level:>3}: {results[str(level)]['requests_per_sec']:.2f} req/s, "
+                          f"p50 {results[str(level)]['latency']['p50_ms']:.1f} ms, "
+                          f"p99 {results[str(level)]['latency']['p99_ms']:.1f} ms, {errors} errors", file=sys.stderr)
+    return results
+
+
+# ── baseline comparison ────────────────────────────────────────────────
+
+def compare(result: dict, baseline: dict) -> float:
+    """Print the p50 change of every stage and HTTP level; return the worst slowdown."""
+    worst = 0.0
+    rows = []
+    for case, entry in result["stages"].items():
+        for stage, stats in entry["stages"].items():
+            old = baseline.get("stages", {}).get(case, {}).get("stages", {}).get(stage)
+            if old:
+                rows.append((f"{case} {stage}", old["p50_ms"], stats["p50_ms"]))
+    for level, entry in result.get("http", {}).items():
+        old = baseline.get("http", {}).get(level)
+        if old:
+            rows.append((f"http x{level}", old["latency"]["p50_ms"], entry["latency"]["p50_ms"]))
+
+    print(f"\n{'p50':<28}{'baseline ms':>14}{'now ms':>12}{'change':>10}")
+    for name, old, new in rows:
+        change = (new - old) / old if old else 0.0
+        worst = max(worst, change)
+        print(f"{name:<28}{old:>14.1f}{new:>12.1f}{change:>+10.1%}")
+    print(f"peak RSS: {baseline.get('peak_rss_mb', 0):.0f} MB -> {result['peak_rss_mb']:.0f} MB")
+    for mode, lengths in result.get("memory", {}).items():
+        for seconds, entry in lengths.items():
+            old = baseline.get("memory", {}).get(mode, {}).get(seconds, {})
+            if "growth_mb" in entry and "growth_mb" in old:
+                print(f"{mode} {seconds} s: +{old['growth_mb']:.0f} MB -> +{entry['growth_mb']:.0f} MB")
+    return worst
+
+
+# ── main ───────────────────────────────────────────────────────────────
+
+def main_() -> None:
+    a = parse_args()
+    cases = make_cases(a.cases, a.seed)
+
+    loaded = model_registry.load(a.model_dir, device=a.device, compile=a.compile, quantize=a.quantize)
+    # a phoneme cache that keeps nothing, so every run pays for espeak
+    gop = GOP(loaded.model, loaded.processor, loaded.device, phoneme_cache=phonemes.PhonemeCache(max_size=0),
+              model_id=loaded.checkpoint_id)
+
+    result = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "platform": platform.platform(),
+            "device": str(loaded.device),
+            "threads": torch.get_num_threads(),
+            "args": {k: v for k, v in vars(a).items() if k not in ("out", "baseline")},
+            "align_engine": GOP.align_engine,
+            "predicted_alignment": GOP.predicted_alignment,
+            "scoring": GOP.scoring,
+        },
+        "stages": run_stages(gop, cases, a.repeats, a.warmup),
+    }
+    if a.concurrency:
+        result["http"] = asyncio.run(run_http(cases, a.concurrency, a.requests, a))
+    if a.memory:
+        result["memory"] = run_memory(a)
+        result["memory_slopes"] = {mode: memory_slopes(entries) for mode, entries in result["memory"].items()}
+    result["peak_rss_mb"] = peak_rss_mb()
+
+    with open(a.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"results written to {a.out}")
+
+    if a.baseline:
+        with open(a.baseline, encoding="utf-8") as f:
+            worst = compare(result, json.load(f))
+        if a.fail_above is not None and worst > a.fail_above:
+            sys.exit(f"p50 regression of {worst:.1%} exceeds {a.fail_above:.0%}")
+    if a.memory and a.memory_slope_ratio is not None:
+        slopes = result["memory_slopes"]["chunked"]
+        if len(slopes) < 2:
+            sys.exit("--memory_slope_ratio needs at least three chunked --memory_lengths that ran")
+        # small slopes are mostly allocator noise, compare against at least 1 MB/s
+        first, last = max(slopes[0]["mb_per_second"], 1.0), slopes[-1]["mb_per_second"]
+        if last > a.memory_slope_ratio * first:
+            sys.exit(f"chunked memory grows {last / first:.1f}x faster at {slopes[-1]['to']} s than at "
+                     f"{slopes[0]['to']} s, above {a.memory_slope_ratio:g}x: not linear in the clip length")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,84 @@
+import types
+
+import numpy as np
+import pytest
+import torch
+
+
+# Stand-ins for the wav2vec2 checkpoint and espeak, so the tests run without
+# downloading a model: one token per letter plus the blank, a convolution with
+# wav2vec2's frame geometry (400-sample receptive field, 320-sample hop), and
+# a phonemizer that spells words letter by letter.
+
+LABELS = ["<pad>"] + list("abcdefghijklmnopqrstuvwxyz")
+SAMPLE_RATE = 16_000
+
+
+class FakeTokenizer:
+    pad_token = "<pad>"
+    pad_token_id = 0
+    decoder = dict(enumerate(LABELS))
+    encoder = {label: i for i, label in enumerate(LABELS)}
+
+    def convert_tokens_to_ids(self, token):
+        return self.encoder.get(token, self.pad_token_id)
+
+
+class FakeProcessor:
+    tokenizer = FakeTokenizer()
+    feature_extractor = types.SimpleNamespace(sampling_rate=SAMPLE_RATE)
+
+    def __call__(self, audio, sampling_rate=None, return_tensors=None):
+        x = torch.as_tensor(np.asarray(audio), dtype=torch.float32).reshape(-1)
+        return types.SimpleNamespace(input_values=((x - x.mean()) / (x.std() + 1e-7))[None])
+
+
+class FakeModel(torch.nn.Module):
+    def __init__(self, seed=0):
+        super().__init__()
+        generator = torch.Generator().manual_seed(seed)
+        self.encoder = torch.nn.Conv1d(1, len(LABELS), 400, 320)
+        with torch.no_grad():
+            self.encoder.weight.copy_(torch.randn(self.encoder.weight.shape, generator=generator) * 0.2)
+            self.encoder.bias.zero_()
+        self.config = types.SimpleNamespace(_name_or_path="fake")
+
+    def forward(self, input_values, attention_mask=None):
+        return types.SimpleNamespace(logits=self.encoder(input_values[:, None]).transpose(1, 2))
+
+    @staticmethod
+    def _get_feat_extract_output_lengths(lengths):
+        return (lengths - 400) // 320 + 1
+
+
+class FakePhonemes:
+    def phonemize(self, words):
+        return [list(word) for word in words]
+
+    def stats(self):
+        return {}
+
+
+def peaky_emission(tokens, rng, blank_id=0, num_labels=len(LABELS), min_gap=1, max_gap=6):
+    """CTC-like log-probabilities: a short run of blanks, then one or two
+    frames of each token, with some noise on every frame."""
+    rows = []
+    for token in tokens:
+        rows += [blank_id] * int(rng.integers(min_gap, max_gap))
+        rows += [token] * int(rng.integers(1, 3))
+    rows += [blank_id] * int(rng.integers(min_gap, max_gap))
+    logits = rng.normal(0.0, 1.0, (len(rows), num_labels)).astype(np.float32)
+    logits[np.arange(len(rows)), rows] += 8.0
+    return torch.from_numpy(logits).log_softmax(-1).numpy()
+
+
+@pytest.fixture
+def fake_phonemes():
+    return FakePhonemes()
+
+
+@pytest.fixture
+def fake_gop(fake_phonemes):
+    from gop_scores import GOP
+
+    return GOP(FakeModel(), FakeProcessor(), "cpu", phoneme_cache=fake_phonemes, model_id="fake")
@@ -1,13 +1,27 @@
+import contextlib
+import functools
+import hashlib
+import io
 import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
 import torch
 import torchaudio
 import IPython
 import numpy as np
 import matplotlib.pyplot as plt
 from dataclasses import dataclass
-from transformers import Wav2Vec2Processor, Wav2Vec2ForCTC
-import phonemizer
-from phonemizer.separator import Separator
+
+import alignment
+import model_registry
+import phonemes
+
+
+# intermediate results of every request; enable with XLSR_DEBUG_LOG=1 in the server
+logger = logging.getLogger(__name__)
 
 @dataclass
 class Segment:
@@ -43,43 +57,347 @@ class PhoneSegment:
     end:float
     lpp:list
 
+def load_audio(audio, sample_rate=None):
+    if isinstance(audio, (torch.Tensor, np.ndarray)):
+        if sample_rate is None:
+            raise ValueError("sample_rate is required for a waveform input")
+        return torch.as_tensor(audio, dtype=torch.float32), sample_rate
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        audio = io.BytesIO(audio)
+    return torchaudio.load(audio)
+
+
+# Resample precomputes its filter kernel, keep one per source sample rate
+@functools.lru_cache(maxsize=16)
+def get_resampler(orig_freq, new_freq):
+    return torchaudio.transforms.Resample(orig_freq=orig_freq, new_freq=new_freq)
+
+
+def overlap_weights(gt_start, gt_end, p_start, p_end):
+    """Overlap/union ratios of every (gt, predicted) pair the loop in
+    phone_scores_loop visits, each divided by the number of predicted
+    segments visited for that gt segment. Returns (row, col, weight) arrays.
+
+    Both segment lists come out of a backtrack, so they are sorted and don't
+    overlap; that lets the visited range of every canonical segment be found
+    with searchsorted instead of walking the predicted segments, and keeps
+    the number of pairs close to n_gt + n_pred instead of n_gt x n_pred.
+    """
+    lo = np.searchsorted(p_end, gt_start, side="left")
+    hi = np.searchsorted(p_start, gt_end, side="left")
+    # the loop resumes one segment before where the previous one stopped
+    prev_hi = 0
+    for k in range(len(lo)):
+        lo[k] = max(lo[k], prev_hi - 1, 0)
+        hi[k] = max(hi[k], lo[k])
+        prev_hi = hi[k]
+
+    counts = hi - lo
+    rows = np.repeat(np.arange(len(lo)), counts)
+    cols = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts) + lo[rows]
+    overlap = np.minimum(gt_end[rows], p_end[cols]) - np.maximum(gt_start[rows], p_start[cols])
+    union = np.maximum(gt_end[rows], p_end[cols]) - np.minimum(gt_start[rows], p_start[cols])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weights = np.where(union > 0, overlap / union, 0.0)
+    return rows, cols, weights / counts[rows]
+
+
+class EmissionCache:
+    """wav2vec2 emissions keyed by (audio content hash, model checkpoint id,
+    whole-clip or windowed run).
+
+    A bounded in-memory LRU, backed optionally by a directory of .npy files
+    that are memory-mapped on read (a disk hit is not copied into RAM) and
+    evicted oldest-first once they take more than `max_disk_bytes`; an evicted
+    file stays readable through the mappings already handed out.
+    """
+
+    def __init__(self, max_memory_bytes=256 * 1024**2, disk_dir=None, max_disk_bytes=2 * 1024**3):
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+
+    @staticmethod
+    def key(audio_input_values, model_id, windowing="whole"):
+        """`windowing` says how wav2vec2 ran over the clip ("whole", or the
+        window and context of a chunked run), as that changes the emission."""
+        digest = hashlib.sha256(model_id.encode())
+        digest.update(b"\0" + windowing.encode() + b"\0")
+        digest.update(audio_input_values.detach().cpu().contiguous().numpy().tobytes())
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+
+        emission = self._read_disk(key)
+        with self._lock:
+            if emission is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, emission)
+        return emission
+
+    def put(self, key, emission):
+        with self._lock:
+            self._remember(key, emission)
+        if self.disk_dir:
+            self._write_disk(key, emission)
+
+    def stats(self):
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_items": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_bytes": self._disk_bytes,
+        }
+
+    def _remember(self, key, emission):
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key).nbytes
+        self._memory[key] = emission
+        self._memory_bytes += emission.nbytes
+        while self._memory_bytes > self.max_memory_bytes and self._memory:
+            self._memory_bytes -= self._memory.popitem(last=False)[1].nbytes
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.npy")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._path(key)
+        try:
+            # copy-on-write: writable without copying, so torch.from_numpy
+            # takes it as is and pages are read when the emission is used
+            emission = np.load(path, mmap_mode="c")
+            os.utime(path)  # mtime doubles as the LRU clock for eviction
+        except (FileNotFoundError, ValueError):
+            return None
+        return torch.from_numpy(emission)
+
+    def _write_disk(self, key, emission):
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, emission.numpy())
+        os.replace(tmp, path)
+        with self._lock:
+            self._disk_bytes += os.path.getsize(path)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    def _disk_files(self):
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".npy"):
+                stat = entry.stat()
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def _evict_disk(self):
+        files = sorted(self._disk_files(), key=lambda f: f[2])
+        self._disk_bytes = sum(size for _, size, _ in files)
+        for path, size, _ in files:
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._disk_bytes -= size
+
+
 class GOP:
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    model = Wav2Vec2ForCTC.from_pretrained("model")
-    processor = Wav2Vec2Processor.from_pretrained("model")
-    emission = None
-    
-    def forward(self, audio_path, transcript):
-        print(f'transcript is: {transcript}')
-        waveform, sample_rate = torchaudio.load(audio_path)
-        print('audio loaded! sample rate is:', sample_rate)
-        if sample_rate != self.processor.feature_extractor.sampling_rate:
-            waveform = torchaudio.transforms.Resample(
-                orig_freq=sample_rate,
-                new_freq=self.processor.feature_extractor.sampling_rate
-            )(waveform)
-            sample_rate = self.processor.feature_extractor.sampling_rate
-
-        audio_input_values = self.processor(waveform.squeeze(), return_tensors="pt").input_values
-        self.audio_duration_sec = audio_input_values.shape[1] / sample_rate
-
-        print(f'audio_duration_sec: {self.audio_duration_sec}')
-        with torch.inference_mode():
-            outputs = self.model(audio_input_values)
-
-        self.emission = outputs.logits[0]
-        logits = outputs.logits[torch.argmax(outputs.logits, dim=-1) != 0]
-        logits = torch.softmax(logits, dim=-1)
-        
-        predicted_phones, real_phones, word_pos = self.get_transcription(transcript, logits)
-        print(f'predicted phones: {predicted_phones}')
-        print(f'real phones: {real_phones}')
-        print(f'word_pos: {word_pos}')
-        aligned_segments, aligned_predicted_segments = self.align_phones(real_phones, predicted_phones)
-        
-        scores = self.gen_scores(aligned_segments, aligned_predicted_segments, logits, transcript, word_pos, real_phones)
+    # "numba" runs the compiled trellis/backtrack from alignment.py,
+    # "torch" keeps the original per-frame implementation for comparison,
+    # "banded" keeps one bit per trellis cell instead of a float, and with
+    # trellis_band only the cells within that many tokens of the greedy path
+    # (None searches them all and gives the "numba" path exactly)
+    align_engine = "numba"
+    trellis_band = 100
+    # clips longer than chunk_sec go through wav2vec2 in overlapping windows
+    # (see streaming.WindowedEmission), so attention memory stays bounded;
+    # None runs every clip in one pass
+    chunk_sec = None
+    chunk_context_sec = 1.0
+    # "trellis" force-aligns the predicted phones like the canonical ones,
+    # "greedy" takes their segments straight from the frame-level argmax
+    predicted_alignment = "trellis"
+    # "matrix" scores every canonical phone at once from the (sparse) overlap
+    # weights, "loop" is the original segment-by-segment implementation
+    scoring = "matrix"
+    # optional callable(stage_name, seconds) told how long each stage of
+    # forward() took: load_resample, processor, forward, phonemize, trellis,
+    # backtrack, greedy and scoring
+    on_stage = None
+
+    def __init__(self, model=None, processor=None, device=None, phoneme_cache=None,
+                 model_id=None, emission_cache=None):
+        # Without explicit arguments the process-wide model from model_registry
+        # is used, so constructing a GOP never loads weights a second time.
+        # The model itself is only loaded on first use, a GOP that just
+        # scores precomputed emissions needs the processor alone.
+        self._model = model
+        self.processor = processor or model_registry.load_processor()
+        if device is None and model is not None:
+            device = next(model.parameters()).device
+        self.device = torch.device(device) if device is not None else None
+        self.phonemes = phoneme_cache or phonemes.default_cache()
+        if model_id is None and model is not None:
+            model_id = getattr(model.config, "_name_or_path", "")
+        self.model_id = model_id
+        self.emission_cache = emission_cache
+
+    @property
+    def model(self):
+        if self._model is None:
+            loaded = model_registry.load()
+            self._model = loaded.model
+            self.device = loaded.device
+            self.model_id = loaded.checkpoint_id
+        return self._model
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.on_stage is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.on_stage(name, time.perf_counter() - start)
+
+    def emission_key(self, audio_input_values):
+        if self.model_id is None:
+            self.model  # loading the model sets model_id
+        windowing = "whole"
+        if self.chunked(audio_input_values):
+            windowing = f"windows:{self.chunk_sec!r}:{self.chunk_context_sec!r}"
+        return EmissionCache.key(audio_input_values, self.model_id, windowing)
+
+    def forward(self, audio, transcript, sample_rate=None):
+        logger.debug('transcript is: %s', transcript)
+        audio_input_values, audio_duration_sec = self.prepare(audio, sample_rate)
+        emission = self.infer(audio_input_values)
+        return self.score(emission, audio_duration_sec, transcript)
+
+    # forward() is split in three stages so that a scheduler can batch the
+    # model call; prepare() and score() only touch their arguments and can
+    # run concurrently on a shared GOP.
+    def prepare(self, audio, sample_rate=None):
+        """`audio` is a file path, raw file bytes, a binary file object, or a
+        waveform tensor/array together with its `sample_rate`."""
+        with self.stage("load_resample"):
+            waveform, sample_rate = load_audio(audio, sample_rate)
+            logger.debug('audio loaded! sample rate is: %s', sample_rate)
+            if sample_rate != self.processor.feature_extractor.sampling_rate:
+                waveform = get_resampler(sample_rate, self.processor.feature_extractor.sampling_rate)(waveform)
+                sample_rate = self.processor.feature_extractor.sampling_rate
+
+        with self.stage("processor"):
+            audio_input_values = self.processor(waveform.squeeze(), return_tensors="pt").input_values
+        audio_duration_sec = audio_input_values.shape[1] / sample_rate
+
+        logger.debug('audio_duration_sec: %s', audio_duration_sec)
+        return audio_input_values, audio_duration_sec
+
+    def infer(self, audio_input_values):
+        key = None
+        if self.emission_cache is not None:
+            key = self.emission_key(audio_input_values)
+            emission = self.emission_cache.get(key)
+            if emission is not None:
+                return emission
+
+        model = self.model
+        with self.stage("forward"), torch.inference_mode():
+            if self.chunked(audio_input_values):
+                windows, parts = self.windows(audio_input_values)
+                for start, values, final in parts:
+                    outputs = model(torch.from_numpy(values)[None].to(self.device))
+                    windows.add(start, outputs.logits[0].float().cpu(), final)
+                emission = windows.emission
+            else:
+                outputs = model(audio_input_values.to(self.device))
+                emission = outputs.logits[0].float().cpu()
+
+        if key is not None:
+            self.emission_cache.put(key, emission)
+        return emission
+
+    def chunked(self, audio_input_values):
+        return (
+            self.chunk_sec is not None
+            and audio_input_values.shape[-1] > self.chunk_sec * self.processor.feature_extractor.sampling_rate
+        )
+
+    def windows(self, audio_input_values):
+        """WindowedEmission and its (start_frame, input_values, final) windows
+        over the whole clip; the clip is normalized once, not per window."""
+        from streaming import WindowedEmission  # streaming imports this module
+
+        windows = WindowedEmission(self.chunk_sec, self.chunk_context_sec)
+        return windows, windows.split(audio_input_values.reshape(-1).numpy())
+
+    def score(self, emission, audio_duration_sec, transcript, canonical=None):
+        logits, aligned_segments, aligned_predicted_segments, real_phones, word_pos = self.align_transcript(
+            emission, audio_duration_sec, transcript, canonical
+        )
+        with self.stage("scoring"):
+            scores = self.gen_scores(aligned_segments, aligned_predicted_segments, logits, transcript, word_pos, real_phones)
         
         return scores
+
+    def align_transcript(self, emission, audio_duration_sec, transcript, canonical=None):
+        """`canonical` is (segments, real_phones, word_pos) from canonical_segments;
+        the transcript's phones are then neither phonemized nor aligned."""
+        logits = emission[torch.argmax(emission, dim=-1) != 0]
+        logits = torch.softmax(logits, dim=-1)
+        
+        if canonical is None:
+            predicted_phones, real_phones, word_pos = self.get_transcription(transcript, logits)
+            aligned_segments = None
+        else:
+            aligned_segments, real_phones, word_pos = canonical
+            predicted_phones = [self.processor.tokenizer.decoder[id.item()] for id in torch.argmax(logits, -1)]
+        logger.debug('predicted phones: %s', predicted_phones)
+        logger.debug('real phones: %s', real_phones)
+        logger.debug('word_pos: %s', word_pos)
+        aligned_segments, aligned_predicted_segments = self.align_phones(
+            real_phones, predicted_phones, emission, audio_duration_sec, aligned_segments=aligned_segments
+        )
+        return logits, aligned_segments, aligned_predicted_segments, real_phones, word_pos
+
+    def canonical_segments(self, store, utt_id):
+        """Canonical phones of `utt_id` from an alignment_store.AlignmentStore
+        (MFA forced alignments) as (segments, real_phones, word_pos, words)."""
+        labels, starts, ends = store.phones(utt_id)
+        words, word_pos = store.words(utt_id)
+        tokenizer = self.processor.tokenizer
+        segments = [
+            # MFA gives no per-phone CTC score
+            Segment(tokenizer.encoder.get(label, tokenizer.pad_token_id), label, start, end, float("nan"))
+            for label, start, end in zip(labels, starts.tolist(), ends.tolist())
+        ]
+        return segments, labels, word_pos, words
         
         
     def get_transcription(self, transcript, logits):
@@ -88,22 +406,32 @@ class GOP:
             for id in torch.argmax(logits, -1)
         ]
         
-        separator = Separator(phone="-", word="|")
+        real_phones, word_pos = self.canonical_phones(transcript)
+        return predicted_phones, real_phones, word_pos
+
+    def canonical_phones(self, transcript):
+        """Phones of the transcript and the [start, end) phone range of every word."""
         real_phones = []
         word_pos = []
         i = 0
-        word_i = 0
         words_in_the_transcript = transcript.split()
 
-        for word in words_in_the_transcript:
-            new_word_phones = phonemizer.phonemize(word, strip=True, separator=separator).split("-")
+        # one batched, cached espeak call for the whole transcript
+        with self.stage("phonemize"):
+            words_phones = self.phonemes.phonemize(words_in_the_transcript)
+        for new_word_phones in words_phones:
             word_pos.append([i, i + len(new_word_phones)])
             real_phones += new_word_phones
             i += len(new_word_phones)
-            
-        return predicted_phones, real_phones, word_pos
+
+        return real_phones, word_pos
     
-    def align_phones(self, real_phones, predicted_phones):
+    def align_phones(self, real_phones, predicted_phones, emission, audio_duration_sec, engine=None,
+                     aligned_segments=None):
+        engine = engine or self.align_engine
+        if engine not in ("numba", "torch", "banded"):
+            raise ValueError(f"unknown align engine: {engine}")
+
         def get_trellis(emission, tokens, blank_id=0):
             num_frame = emission.size(0)
             num_tokens = len(tokens)
@@ -183,36 +511,137 @@ class GOP:
             return path[::-1]
 
 
-        def align(text):
-            transcript = text
-            indexed_tokens = [self.processor.tokenizer.encoder.get(c, self.processor.tokenizer.pad_token_id) for c in transcript]
-
-            trellis = get_trellis(self.emission, indexed_tokens)
-            path = backtrack(trellis, self.emission, indexed_tokens)
+        def merge_runs(token_index, scores, transcript, audio_duration_sec):
+            ratio = audio_duration_sec / len(token_index)
+            starts, ends, means = alignment.merge_runs(token_index, scores)
+            segments = []
+            for start, end, score in zip(starts.tolist(), ends.tolist(), means.tolist()):
+                label = transcript[token_index[start]]
+                if label != self.processor.tokenizer.pad_token:
+                    segments.append(
+                        Segment(
+                            self.processor.tokenizer.convert_tokens_to_ids(label),
+                            label,
+                            start * ratio,
+                            end * ratio,
+                            score,
+                        )
+                    )
+            return segments
 
-            aligned_segments = merge_repeats(path, transcript, trellis, self.audio_duration_sec)
 
-            return aligned_segments
+        emission_np = emission.detach().cpu().numpy()
+        if engine != "torch":
+            emission = emission_np
 
-        aligned_segments = align(real_phones)
-        aligned_predicted_segments = align(predicted_phones)
+        def align(text):
+            transcript = text
+            indexed_tokens = [self.processor.tokenizer.encoder.get(c, self.processor.tokenizer.pad_token_id) for c in transcript]
 
-        print(aligned_segments)
-        print(aligned_predicted_segments)
+            if engine == "torch":
+                with self.stage("trellis"):
+                    trellis = get_trellis(emission, indexed_tokens)
+                with self.stage("backtrack"):
+                    path = backtrack(trellis, emission, indexed_tokens)
+                    return merge_repeats(path, transcript, trellis, audio_duration_sec)
+
+            if engine == "banded":
+                # fill and backtrack are one call here, both timed as trellis
+                with self.stage("trellis"):
+                    token_index, scores = alignment.align_path(emission, indexed_tokens, band=self.trellis_band)
+                with self.stage("backtrack"):
+                    return merge_runs(token_index, scores, transcript, audio_duration_sec)
+
+            with self.stage("trellis"):
+                trellis = alignment.get_trellis(emission, indexed_tokens)
+            with self.stage("backtrack"):
+                token_index, scores = alignment.backtrack(trellis, emission, indexed_tokens)
+                return merge_runs(token_index, scores, transcript, audio_duration_sec)
+
+        def greedy(text):
+            ratio = audio_duration_sec / emission_np.shape[0]
+            with self.stage("greedy"):
+                starts, ends, means = alignment.greedy_segments(emission_np)
+            return [
+                Segment(
+                    self.processor.tokenizer.convert_tokens_to_ids(label),
+                    label,
+                    start * ratio,
+                    end * ratio,
+                    score,
+                )
+                for label, start, end, score in zip(text, starts.tolist(), ends.tolist(), means.tolist())
+            ]
+
+        if aligned_segments is None:
+            aligned_segments = align(real_phones)
+        if self.predicted_alignment == "greedy":
+            aligned_predicted_segments = greedy(predicted_phones)
+        else:
+            aligned_predicted_segments = align(predicted_phones)
+
+        logger.debug('%s', aligned_segments)
+        logger.debug('%s', aligned_predicted_segments)
         
         return aligned_segments, aligned_predicted_segments
         
     def gen_scores(self, aligned_segments, aligned_predicted_segments, logits, transcript, word_pos, real_phones):
-        merged_gt = []
-        merged_p = []
-        score = []
-        i = 0
-        duration = 0
+        if self.scoring == "loop":
+            score = self.phone_scores_loop(aligned_segments, aligned_predicted_segments, logits)
+        else:
+            score = self.phone_scores(aligned_segments, aligned_predicted_segments, logits)
+        # score
 
-        final_feat = []
+        words = transcript.split()
+        final_result = []
+        for word, w_pos in zip(words, word_pos):
+            final_result.append({
+                'word': word,
+                'phones': [],
+            })
+            for i in range(w_pos[0], w_pos[1]):
+                final_result[-1]['phones'].append({
+                    'real_phone': score[i][0],
+                    'predicted_phone': score[i][1],
+                    'score': f'{score[i][2]:.2f}'
+                })
+        if logger.isEnabledFor(logging.DEBUG):
+            for word, w_pos in zip(words, word_pos):
+                logger.debug('%s -> %s', word, real_phones[w_pos[0]: w_pos[1]])
+                for i in range(w_pos[0], w_pos[1]):
+                    logger.debug('\t%s', score[i])
+        return final_result
 
-        logit_id = 0
+    def phone_scores(self, aligned_segments, aligned_predicted_segments, logits):
+        decoder = self.processor.tokenizer.decoder
+        if not aligned_segments:
+            return []
+        gt_start = np.array([seg.start for seg in aligned_segments])
+        gt_end = np.array([seg.end for seg in aligned_segments])
+        gt_id = np.array([seg.id for seg in aligned_segments])
+
+        n = min(len(aligned_predicted_segments), logits.shape[0])
+        p_start = np.array([seg.start for seg in aligned_predicted_segments[:n]])
+        p_end = np.array([seg.end for seg in aligned_predicted_segments[:n]])
+
+        rows, cols, weights = overlap_weights(gt_start, gt_end, p_start, p_end)
+        # weighted sum of the visited logits rows, without a gt x predicted matrix
+        lpp = torch.zeros(len(gt_id), logits.shape[1], dtype=torch.float64)
+        lpp.index_add_(0, torch.from_numpy(rows), logits[torch.from_numpy(cols)].double() * torch.from_numpy(weights)[:, None])
+
+        gop = lpp[torch.arange(len(gt_id)), torch.from_numpy(gt_id)] - lpp.max(dim=1).values
+        predicted = lpp.argmax(dim=1)
+        return [
+            [decoder[i], decoder[p], 100*(10**g)]
+            for i, p, g in zip(gt_id.tolist(), predicted.tolist(), gop.tolist())
+        ]
 
+    # original per-segment loop (scoring = "loop"), the reference for
+    # phone_scores in test_scoring.py
+    def phone_scores_loop(self, aligned_segments, aligned_predicted_segments, logits):
+        score = []
+        i = 0
+        duration = 0
 
         for id, gt_frame in enumerate(aligned_segments):
             if i>=1:
@@ -232,23 +661,4 @@ class GOP:
                 tmp_lpp_part /= duration
             gop = tmp_lpp_part[gt_frame.id] - max(tmp_lpp_part)
             score.append([self.processor.tokenizer.decoder[gt_frame.id], self.processor.tokenizer.decoder[np.argmax(tmp_lpp_part).item()], 100*(10**float(gop))])
-        # score
-
-        words = transcript.split()
-        final_result = []
-        for word, w_pos in zip(words, word_pos):
-            final_result.append({
-                'word': word,
-                'phones': [],
-            })
-            print(word, '->', real_phones[w_pos[0]: w_pos[1]])
-            for i in range(w_pos[0], w_pos[1]):
-                final_result[-1]['phones'].append({
-                    'real_phone': score[i][0],
-                    'predicted_phone': score[i][1],
-                    'score': f'{score[i][2]:.2f}'
-                })
-                print('', score[i], sep='\t')
-            print()
-        return final_result
-
+        return score
@@ -0,0 +1,133 @@
+import contextvars
+import threading
+from bisect import bisect_left
+
+
+# Process-wide request metrics in the Prometheus text format, served by
+# GET /metrics. Stage timings come from GOP.on_stage and BatchScheduler.on_stage;
+# while a request is being handled they are also collected per request (a
+# context variable, so they follow the request into the thread pool) and can be
+# returned in a Server-Timing header.
+
+# seconds; wav2vec2 on a minute of audio on CPU takes a few seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RTF_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = float(value)
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket (last is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts[0][i] += 1
+            counts[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for le, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    le_labels = _labels(self.labelnames + ("le",), labels + (le,))
+                    lines.append(f"{self.name}_bucket{le_labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "xlsr_stage_seconds",
+    "Time spent in each stage of a request (load_resample, processor, queue_wait, forward, phonemize, trellis, backtrack, greedy, scoring).",
+    ("stage",),
+)
+REQUEST_SECONDS = Histogram("xlsr_request_seconds", "End-to-end request handling time.", ("endpoint",))
+REQUESTS = Counter("xlsr_requests_total", "Handled requests.", ("endpoint", "status"))
+AUDIO_SECONDS = Counter("xlsr_audio_seconds_total", "Seconds of audio scored.")
+REAL_TIME_FACTOR = Histogram(
+    "xlsr_real_time_factor", "Request handling time divided by audio duration.", buckets=RTF_BUCKETS
+)
+QUEUE_DEPTH = Gauge("xlsr_queue_depth", "Requests waiting for the model.")
+METRICS = [STAGE_SECONDS, REQUEST_SECONDS, REQUESTS, AUDIO_SECONDS, REAL_TIME_FACTOR, QUEUE_DEPTH]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def record_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def start_request():
+    """Collect the stages recorded from here on in the current context; returns the dict."""
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def observe_request(endpoint, status, seconds, audio_seconds=None):
+    REQUESTS.inc(1, endpoint, str(status))
+    REQUEST_SECONDS.observe(seconds, endpoint)
+    if audio_seconds:
+        AUDIO_SECONDS.inc(audio_seconds)
+        REAL_TIME_FACTOR.observe(seconds / audio_seconds)
+
+
+def server_timing(timings, total=None):
+    """Server-Timing header value, durations in milliseconds."""
+    entries = [f"{stage};dur={1000 * seconds:.1f}" for stage, seconds in timings.items()]
+    if total is not None:
+        entries.append(f"total;dur={1000 * total:.1f}")
+    return ", ".join(entries)
+
+
+def render():
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
@@ -1,30 +1,292 @@
-from fastapi import FastAPI, File, UploadFile, Form
-from fastapi.responses import FileResponse  # Add this line
-import shutil
-import requests
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import List
 
-from gop_scores import GOP
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse  # Add this line
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel
+import io
+import torch
 
+import instrumentation
+import model_registry
+import prefork
+import streaming
+from gop_scores import GOP, EmissionCache
+from scheduler import BatchScheduler, QueueFull
 
-app = FastAPI()
 
-print('Loading model...')
-gop = GOP()
-print('model loaded...')
+MODEL_DIR = model_registry.MODEL_DIR
+DEVICE = os.environ.get("XLSR_DEVICE") or None
+COMPILE = os.environ.get("XLSR_COMPILE", "0") == "1"
+QUANTIZE = os.environ.get("XLSR_QUANTIZE", "0") == "1"
+WARMUP_SECONDS = float(os.environ.get("XLSR_WARMUP_SECONDS", "1.0"))
+BATCH_SIZE = int(os.environ.get("XLSR_BATCH_SIZE", "8"))
+BATCH_WAIT_MS = float(os.environ.get("XLSR_BATCH_WAIT_MS", "10"))
+QUEUE_DEPTH = int(os.environ.get("XLSR_QUEUE_DEPTH", "64"))
+EMISSION_CACHE_MB = float(os.environ.get("XLSR_EMISSION_CACHE_MB", "256"))
+EMISSION_CACHE_DIR = os.environ.get("XLSR_EMISSION_CACHE_DIR") or None
+EMISSION_CACHE_DISK_MB = float(os.environ.get("XLSR_EMISSION_CACHE_DISK_MB", "2048"))
+# keep a copy of the last upload on disk for GET /audio
+DEBUG_CAPTURE = os.environ.get("XLSR_DEBUG_CAPTURE", "0") == "1"
+DEBUG_AUDIO_PATH = "audio.wav"
+# TorchScript scorer written by gopt_pipeline/gopt.py --torchscript
+GOPT_MODEL = os.environ.get("XLSR_GOPT_MODEL") or None
+# log GOP's intermediate results (phones, alignments, per-word scores)
+DEBUG_LOG = os.environ.get("XLSR_DEBUG_LOG", "0") == "1"
+# add a Server-Timing header with the stage durations to /upload-audio responses
+TIMING_HEADER = os.environ.get("XLSR_TIMING_HEADER", "0") == "1"
+# long recordings: wav2vec2 in windows of this many seconds, and the
+# alignment engine with the trellis band it uses (see GOP)
+CHUNK_SEC = float(os.environ.get("XLSR_CHUNK_SEC", "0")) or None
+ALIGN_ENGINE = os.environ.get("XLSR_ALIGN_ENGINE", GOP.align_engine)
+TRELLIS_BAND = int(os.environ.get("XLSR_TRELLIS_BAND", str(GOP.trellis_band))) or None
+# segments of the model's own phones: backtracked through the trellis, or
+# read off the greedy CTC path without one
+PREDICTED_ALIGNMENT = os.environ.get("XLSR_PREDICTED_ALIGNMENT", GOP.predicted_alignment)
+if PREDICTED_ALIGNMENT not in ("trellis", "greedy"):
+    raise ValueError(f"XLSR_PREDICTED_ALIGNMENT must be trellis or greedy, not {PREDICTED_ALIGNMENT!r}")
+# wav2vec2 windows of the /stream endpoint
+STREAM_WINDOW_SEC = float(os.environ.get("XLSR_STREAM_WINDOW_SEC", str(streaming.WINDOW_SEC)))
+STREAM_CONTEXT_SEC = float(os.environ.get("XLSR_STREAM_CONTEXT_SEC", str(streaming.CONTEXT_SEC)))
+# score uploads in this many forked processes sharing one copy of the model,
+# each on its own cores with this many torch threads (0: cores / workers)
+PREFORK_WORKERS = int(os.environ.get("XLSR_PREFORK_WORKERS", "0"))
+THREADS_PER_WORKER = int(os.environ.get("XLSR_THREADS_PER_WORKER", "0")) or None
 
-@app.post("/upload-audio")
-async def upload_audio(audio: UploadFile = File(...), transcript: str = Form(...)):
-    with open("audio.wav", "wb") as buffer:
-        shutil.copyfileobj(audio.file, buffer)
-    
-    scores = GOP().forward(
-        'audio.wav',
-        transcript
+if DEBUG_LOG:
+    logging.basicConfig()
+    logging.getLogger("gop_scores").setLevel(logging.DEBUG)
+
+gop = None
+scheduler = None
+workers = None
+gopt_scorer = None
+ready = False
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global gop, scheduler, workers, gopt_scorer, ready
+    print('Loading model...')
+    loaded = model_registry.load(MODEL_DIR, device=DEVICE, compile=COMPILE, quantize=QUANTIZE)
+    emission_cache = None
+    if EMISSION_CACHE_MB > 0 or EMISSION_CACHE_DIR:
+        emission_cache = EmissionCache(
+            max_memory_bytes=int(EMISSION_CACHE_MB * 1024**2),
+            disk_dir=EMISSION_CACHE_DIR,
+            max_disk_bytes=int(EMISSION_CACHE_DISK_MB * 1024**2),
+        )
+    gop = GOP(
+        loaded.model,
+        loaded.processor,
+        loaded.device,
+        model_id=loaded.checkpoint_id,
+        emission_cache=emission_cache,
     )
+    gop.on_stage = instrumentation.record_stage
+    gop.chunk_sec = CHUNK_SEC
+    gop.align_engine = ALIGN_ENGINE
+    gop.trellis_band = TRELLIS_BAND
+    gop.predicted_alignment = PREDICTED_ALIGNMENT
+    if PREFORK_WORKERS > 0:
+        # before this process runs the model, see prefork.py
+        workers = prefork.WorkerPool(
+            gop, PREFORK_WORKERS, THREADS_PER_WORKER, max_queue=QUEUE_DEPTH, warmup_seconds=WARMUP_SECONDS
+        )
+        workers.on_stage = instrumentation.record_stage
+        await workers.start()
+    if WARMUP_SECONDS > 0:
+        model_registry.warmup(loaded, seconds=WARMUP_SECONDS)
+    scheduler = BatchScheduler(
+        loaded.model,
+        loaded.device,
+        max_batch_size=BATCH_SIZE,
+        max_wait_ms=BATCH_WAIT_MS,
+        max_queue=QUEUE_DEPTH,
+    )
+    scheduler.on_stage = instrumentation.record_stage
+    scheduler.start()
+    if GOPT_MODEL:
+        gopt_scorer = torch.jit.load(GOPT_MODEL, map_location="cpu").eval()
+    ready = True
+    print('model loaded...')
+    yield
+    ready = False
+    await scheduler.stop()
+    if workers is not None:
+        await workers.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
 
+@app.get("/ready")
+async def get_ready():
+    if not ready or (workers is not None and not workers.live):
+        return JSONResponse({"ready": False}, status_code=503)
+    return {"ready": True}
+
+@app.get("/scheduler")
+async def get_scheduler_stats():
+    return scheduler.stats.snapshot()
+
+@app.get("/workers")
+async def get_workers():
+    if workers is None:
+        raise HTTPException(status_code=404, detail="start the server with XLSR_PREFORK_WORKERS set to fork scoring workers")
+    return workers.stats()
+
+@app.get("/cache")
+async def get_cache_stats():
+    return {
+        "emission": gop.emission_cache.stats() if gop.emission_cache is not None else None,
+        "phonemes": gop.phonemes.stats(),
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    depth = scheduler.stats.queue_depth if scheduler is not None else 0
+    instrumentation.QUEUE_DEPTH.set(depth + (workers.pending if workers is not None else 0))
+    return PlainTextResponse(instrumentation.render(), media_type=instrumentation.CONTENT_TYPE)
+
+@app.post("/upload-audio")
+async def upload_audio(response: Response, audio: UploadFile = File(...), transcript: str = Form(...)):
+    started = time.perf_counter()
+    timings = instrumentation.start_request()
+    try:
+        scores, audio_duration_sec = await score_upload(audio, transcript)
+    except HTTPException as e:
+        instrumentation.observe_request("upload-audio", e.status_code, time.perf_counter() - started)
+        raise
+    except Exception:
+        instrumentation.observe_request("upload-audio", 500, time.perf_counter() - started)
+        raise
+    elapsed = time.perf_counter() - started
+    instrumentation.observe_request("upload-audio", 200, elapsed, audio_duration_sec)
+    if TIMING_HEADER:
+        response.headers["Server-Timing"] = instrumentation.server_timing(timings, elapsed)
     return scores
 
+async def score_upload(audio, transcript):
+    data = await audio.read()
+    if DEBUG_CAPTURE:
+        with open(DEBUG_AUDIO_PATH, "wb") as buffer:
+            buffer.write(data)
+
+    if workers is not None:
+        try:
+            return await workers.submit(data, transcript)
+        except (QueueFull, prefork.NoWorkers) as e:
+            raise HTTPException(status_code=503, detail=str(e))
+
+    audio_input_values, audio_duration_sec = await run_in_threadpool(gop.prepare, io.BytesIO(data))
+
+    # a retried recording skips the model entirely; hashing the audio and the
+    # disk tier block, so they run in the thread pool
+    key, emission = None, None
+    if gop.emission_cache is not None:
+        key = await run_in_threadpool(gop.emission_key, audio_input_values)
+        emission = await run_in_threadpool(gop.emission_cache.get, key)
+
+    if emission is None:
+        try:
+            if gop.chunked(audio_input_values):
+                windows, parts = gop.windows(audio_input_values)
+                for start, values, final in parts:
+                    windows.add(start, await scheduler.submit(torch.from_numpy(values)), final)
+                emission = windows.emission
+            else:
+                emission = await scheduler.submit(audio_input_values)
+        except QueueFull as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        if key is not None:
+            await run_in_threadpool(gop.emission_cache.put, key, emission)
+
+    scores = await run_in_threadpool(gop.score, emission, audio_duration_sec, transcript)
+
+    return scores, audio_duration_sec
+
+class GoptRequest(BaseModel):
+    # one entry per utterance: [phones, feat_dim] GOP features normalized as
+    # in GoPDataset, and the phone ids
+    feats: List[List[List[float]]]
+    phns: List[List[int]]
+
+
+def run_gopt(feats, phns):
+    lengths = torch.tensor([len(f) for f in feats])
+    feats = torch.nn.utils.rnn.pad_sequence([torch.tensor(f) for f in feats], batch_first=True)
+    phns = torch.nn.utils.rnn.pad_sequence([torch.tensor(p) for p in phns], batch_first=True, padding_value=-1)
+    with torch.inference_mode():
+        utt, phn, word = gopt_scorer(feats, phns, lengths)
+    return [
+        {"utt": utt[i].tolist(), "phn": phn[i, :n].tolist(), "word": word[i, :n].tolist()}
+        for i, n in enumerate(lengths.tolist())
+    ]
+
+@app.post("/gopt-score")
+async def gopt_score(request: GoptRequest):
+    if gopt_scorer is None:
+        raise HTTPException(status_code=404, detail="start the server with XLSR_GOPT_MODEL set to a TorchScript GOPT export")
+    if len(request.feats) != len(request.phns) or any(len(f) != len(p) for f, p in zip(request.feats, request.phns)):
+        raise HTTPException(status_code=422, detail="feats and phns must have one row per phone")
+    return await run_in_threadpool(run_gopt, request.feats, request.phns)
+
+@app.websocket("/stream")
+async def stream(websocket: WebSocket):
+    """First message: {"transcript": "..."}. Then binary messages of 16 kHz mono
+    16-bit PCM as it is recorded, and {"event": "end"} when the recording stops.
+    Sends {"type": "word", ...} for every word once its alignment is settled
+    and {"type": "final", "result": [...]}, the /upload-audio result, at the end."""
+    await websocket.accept()
+    try:
+        start = await websocket.receive_json()
+        transcript = start.get("transcript", "")
+        windows = streaming.WindowedEmission(STREAM_WINDOW_SEC, STREAM_CONTEXT_SEC)
+        scorer = await run_in_threadpool(streaming.StreamingScorer, gop, transcript)
+
+        async def run(ready, final=False):
+            for window_start, samples in ready:
+                processed = await run_in_threadpool(gop.processor, samples, return_tensors="pt")
+                windows.add(window_start, await scheduler.submit(processed.input_values), final)
+            if ready and not final:
+                for word in await run_in_threadpool(scorer.update, windows.emission):
+                    await websocket.send_json({"type": "word", **word})
+
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes") is not None:
+                await run(windows.feed_pcm16(message["bytes"]))
+            elif message.get("text") is not None:
+                break
+
+        # shorter than one wav2vec2 receptive field
+        if windows.num_samples < 400:
+            await websocket.close(code=1003, reason="no audio received")
+            return
+        # time from the end of the recording to the final result
+        started = time.perf_counter()
+        await run(windows.finish(), final=True)
+        result = await run_in_threadpool(scorer.finish, windows.emission, windows.num_samples)
+        instrumentation.observe_request(
+            "stream", 200, time.perf_counter() - started, windows.num_samples / streaming.SAMPLE_RATE
+        )
+        await websocket.send_json({"type": "final", "result": result})
+        await websocket.close()
+    except QueueFull as e:
+        instrumentation.observe_request("stream", 503, 0.0)
+        await websocket.close(code=1013, reason=str(e))
+    except WebSocketDisconnect:
+        pass
+
 @app.get("/audio")
 async def get_audio():
-    return FileResponse("audio.wav")
-
+    if not DEBUG_CAPTURE or not os.path.exists(DEBUG_AUDIO_PATH):
+        raise HTTPException(status_code=404, detail="start the server with XLSR_DEBUG_CAPTURE=1 to keep uploads")
+    return FileResponse(DEBUG_AUDIO_PATH)
@@ -0,0 +1,85 @@
+import os
+from dataclasses import dataclass
+
+import torch
+from transformers import Wav2Vec2Processor, Wav2Vec2ForCTC
+
+
+MODEL_DIR = os.environ.get("XLSR_MODEL_DIR", "model")
+
+
+@dataclass
+class LoadedModel:
+    model: torch.nn.Module
+    processor: Wav2Vec2Processor
+    device: torch.device
+    compiled: bool = False
+    quantized: bool = False
+    # identifies the weights, e.g. to key cached emissions
+    checkpoint_id: str = ""
+
+
+# one entry per (model_dir, device, compile, quantize), so every caller in
+# the process shares the same weights
+_loaded = {}
+_processors = {}
+
+
+def checkpoint_id(model_dir=MODEL_DIR):
+    """Path, size and mtime of the weights file; changes whenever the checkpoint does."""
+    for name in ("model.safetensors", "pytorch_model.bin"):
+        path = os.path.join(model_dir, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return os.path.abspath(model_dir)
+
+
+def default_device():
+    return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def load(model_dir=MODEL_DIR, device=None, compile=False, quantize=False):
+    device = torch.device(device) if device is not None else default_device()
+    key = (model_dir, str(device), compile, quantize)
+    if key in _loaded:
+        return _loaded[key]
+
+    processor = Wav2Vec2Processor.from_pretrained(model_dir)
+    model = Wav2Vec2ForCTC.from_pretrained(model_dir)
+    model.eval()
+
+    if quantize:
+        if device.type != "cpu":
+            raise ValueError("dynamic int8 quantization is only supported on CPU")
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    model = model.to(device)
+    if compile:
+        # input length changes on every request
+        model = torch.compile(model, dynamic=True)
+
+    revision = checkpoint_id(model_dir) + ("+int8" if quantize else "")
+    _loaded[key] = LoadedModel(model, processor, device, compile, quantize, revision)
+    return _loaded[key]
+
+
+def load_processor(model_dir=MODEL_DIR):
+    """Processor only, for processes that score emissions but never run the model."""
+    for (loaded_dir, *_), loaded in _loaded.items():
+        if loaded_dir == model_dir:
+            return loaded.processor
+    if model_dir not in _processors:
+        _processors[model_dir] = Wav2Vec2Processor.from_pretrained(model_dir)
+    return _processors[model_dir]
+
+
+def warmup(loaded, seconds=1.0, runs=2):
+    """Run the model on a silent clip so the first real request doesn't pay
+    for lazy initialisation (and compilation when torch.compile is on)."""
+    sample_rate = loaded.processor.feature_extractor.sampling_rate
+    dummy = torch.zeros(int(sample_rate * seconds))
+    input_values = loaded.processor(dummy, sampling_rate=sample_rate, return_tensors="pt").input_values
+    with torch.inference_mode():
+        for _ in range(runs):
+            loaded.model(input_values.to(loaded.device))
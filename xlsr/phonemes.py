@@ -0,0 +1,131 @@
+import argparse
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from phonemizer.backend import EspeakBackend
+from phonemizer.separator import Separator
+
+
+SEPARATOR = Separator(phone="-", word="|")
+LANGUAGE = "en-us"
+
+
+class PhonemeCache:
+    """word -> phones, phonemized with one persistent espeak backend.
+
+    Words are looked up lowercased, like the vocabulary 03.prepare_vocab.sh
+    writes for prewarm, so "The" and "the" share an entry. Lookups go through
+    a bounded in-memory LRU, then the optional SQLite store at `db_path`; the
+    words that are still missing are sent to espeak in a single batched call.
+    Output is the same as calling
+    `phonemizer.phonemize(word.lower(), strip=True, separator=SEPARATOR)` per word.
+    """
+
+    def __init__(self, language=LANGUAGE, max_size=100_000, db_path=None):
+        self.language = language
+        self.max_size = max_size
+        self.db_path = db_path
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._backend = None
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS phones (word TEXT PRIMARY KEY, phones TEXT NOT NULL)")
+            self._db.commit()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = EspeakBackend(self.language)
+        return self._backend
+
+    def phonemize(self, words):
+        """Return one list of phones per word in `words`."""
+        words = [word.lower() for word in words]
+        with self._lock:
+            found = {}
+            missing = []
+            for word in dict.fromkeys(words):
+                if word in self._lru:
+                    found[word] = self._lru[word]
+                else:
+                    missing.append(word)
+            self.hits += len(found)
+
+            if missing and self._db is not None:
+                from_db = self._select(missing)
+                self.disk_hits += len(from_db)
+                found.update(from_db)
+                missing = [word for word in missing if word not in from_db]
+            self.misses += len(missing)
+
+            if missing:
+                phonemized = self.backend.phonemize(missing, separator=SEPARATOR, strip=True)
+                new = dict(zip(missing, phonemized))
+                found.update(new)
+                if self._db is not None:
+                    self._db.executemany("INSERT OR REPLACE INTO phones VALUES (?, ?)", new.items())
+                    self._db.commit()
+
+            for word, phones in found.items():
+                self._lru[word] = phones
+                self._lru.move_to_end(word)
+            while len(self._lru) > self.max_size:
+                self._lru.popitem(last=False)
+
+        return [found[word].split("-") for word in words]
+
+    def _select(self, words):
+        result = {}
+        # stay below SQLite's bound-parameter limit
+        for i in range(0, len(words), 500):
+            chunk = words[i : i + 500]
+            rows = self._db.execute(
+                f"SELECT word, phones FROM phones WHERE word IN ({','.join('?' * len(chunk))})", chunk
+            )
+            result.update(rows)
+        return result
+
+    def prewarm(self, vocab_path, batch_size=2000):
+        """Phonemize every word of a vocabulary file (one word per line,
+        as written by 03.prepare_vocab.sh)."""
+        with open(vocab_path, encoding="utf-8") as f:
+            words = [line.strip() for line in f if line.strip()]
+        for i in range(0, len(words), batch_size):
+            self.phonemize(words[i : i + batch_size])
+        return len(words)
+
+    def stats(self):
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses, "size": len(self._lru)}
+
+
+_default = None
+
+
+def default_cache():
+    """Process-wide cache, configured by XLSR_PHONEME_DB / XLSR_PHONEME_CACHE_SIZE."""
+    global _default
+    if _default is None:
+        _default = PhonemeCache(
+            max_size=int(os.environ.get("XLSR_PHONEME_CACHE_SIZE", "100000")),
+            db_path=os.environ.get("XLSR_PHONEME_DB") or None,
+        )
+    return _default
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prewarm the phoneme store from a vocabulary file")
+    parser.add_argument("vocab", help="vocabulary file, e.g. the output of 03.prepare_vocab.sh")
+    parser.add_argument("--db", default="phonemes.sqlite", help="SQLite store to fill")
+    parser.add_argument("--language", default=LANGUAGE)
+    args = parser.parse_args()
+
+    cache = PhonemeCache(language=args.language, db_path=args.db)
+    count = cache.prewarm(args.vocab)
+    print(f"{count} words phonemized into {args.db}")
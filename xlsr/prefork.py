@@ -0,0 +1,245 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import signal
+import time
+from collections import deque
+
+import torch
+
+import model_registry
+from scheduler import QueueFull
+
+
+# Serving mode for several CPU workers without a model copy in each: the
+# server process loads wav2vec2, moves its weights to shared memory and forks
+# the workers, which inherit the model (and everything else GOP holds) instead
+# of loading it. Each worker gets its own cores and torch threads and scores
+# whole /upload-audio requests, one at a time; the server hands requests out
+# round-robin over one pipe per worker. Fork before the server process runs
+# the model itself: torch's OpenMP thread pool does not survive a fork. For
+# the same reason a worker that exits is not replaced, requests go to the
+# workers that are left.
+
+
+class NoWorkers(Exception):
+    """Every forked worker has exited."""
+
+
+def worker_cores(index, workers, threads):
+    """CPUs of worker `index`: consecutive blocks of `threads` cores, wrapping
+    around when there are fewer cores than workers x threads."""
+    cores = sorted(os.sched_getaffinity(0))
+    return {cores[(index * threads + k) % len(cores)] for k in range(min(threads, len(cores)))}
+
+
+class _Worker:
+    def __init__(self, index, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        # futures of the requests sent and not answered yet; the worker answers in order
+        self.waiting = deque()
+        self.send_lock = asyncio.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.alive = True
+
+
+class WorkerPool:
+    """Forked scoring processes sharing the model of `gop`.
+
+    `start` forks the workers and waits until each has warmed up. `submit`
+    sends (upload bytes, transcript) to the next worker in turn and resolves
+    to (scores, audio_duration_sec), as GOP.prepare/infer/score would return
+    them. At most `max_queue` requests wait or run at a time, QueueFull beyond.
+    A worker that exits fails the requests it had and gets no more; NoWorkers
+    once none are left.
+    """
+
+    # called as on_stage(stage, seconds) with the stages the worker timed
+    # (queue_wait, load_resample, processor, forward, ...) of each request
+    on_stage = None
+
+    def __init__(self, gop, workers, threads=None, max_queue=64, warmup_seconds=1.0):
+        if gop.device is not None and gop.device.type != "cpu":
+            raise ValueError("forked workers can only share a model on the CPU")
+        self.gop = gop
+        self.num_workers = workers
+        self.threads = threads or max(1, len(os.sched_getaffinity(0)) // workers)
+        self.max_queue = max_queue
+        self.warmup_seconds = warmup_seconds
+        self.pending = 0
+        self.rejected = 0
+        self._workers = []
+        self._next = 0
+        self._loop = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        # weights in shared memory stay shared whatever a worker touches;
+        # copy-on-write alone would copy every page a worker writes to
+        self.gop.model.share_memory()
+        context = multiprocessing.get_context("fork")
+        parent_ends, ready = [], []
+        for index in range(self.num_workers):
+            parent_end, child_end = context.Pipe()
+            process = context.Process(
+                target=self._serve,
+                args=(index, child_end, parent_ends + [parent_end]),
+                name=f"xlsr-worker-{index}",
+                daemon=True,
+            )
+            process.start()
+            child_end.close()
+            parent_ends.append(parent_end)
+            worker = _Worker(index, process, parent_end)
+            # the first message of every worker says it is warm
+            ready.append(self._loop.create_future())
+            worker.waiting.append(ready[-1])
+            self._loop.add_reader(parent_end.fileno(), self._receive, worker)
+            self._workers.append(worker)
+        await asyncio.gather(*ready)
+
+    async def submit(self, data, transcript):
+        if self.pending >= self.max_queue:
+            self.rejected += 1
+            raise QueueFull(f"{self.pending} requests already waiting")
+        worker = self._pick()
+        future = self._loop.create_future()
+        self.pending += 1
+        try:
+            await worker.send_lock.acquire()
+            worker.waiting.append(future)
+            # a busy worker leaves the request in the pipe; sending in a thread
+            # keeps a full pipe from blocking the event loop
+            send = self._loop.run_in_executor(None, worker.conn.send, (time.time(), data, transcript))
+            send.add_done_callback(lambda send: self._sent(worker, future, send))
+            # cancelling the request doesn't stop a send that has started, so
+            # the lock is released by _sent once the pipe is free
+            await asyncio.shield(send)
+            # cancelled from here on, the future keeps its place in `waiting`
+            # for the answer the worker still sends, and _receive drops that
+            status, result = await future
+        finally:
+            self.pending -= 1
+        worker.requests += 1
+        if status == "error":
+            worker.errors += 1
+            raise RuntimeError(f"worker {worker.index}: {result}")
+        scores, audio_duration_sec, timings = result
+        if self.on_stage is not None:
+            for stage, seconds in timings.items():
+                self.on_stage(stage, seconds)
+        return scores, audio_duration_sec
+
+    def _pick(self):
+        # next live worker in turn; the pipe's EOF may not have been read yet
+        # when a worker dies, so its process is checked too
+        for _ in range(len(self._workers)):
+            worker = self._workers[self._next]
+            self._next = (self._next + 1) % len(self._workers)
+            if worker.alive and worker.process.is_alive():
+                return worker
+        raise NoWorkers(f"all {len(self._workers)} scoring workers have exited")
+
+    @property
+    def live(self):
+        return sum(worker.alive and worker.process.is_alive() for worker in self._workers)
+
+    def _sent(self, worker, future, send):
+        # a request that never reached the worker gets no answer; nothing was
+        # sent after it yet (the lock is still held), so no later answer can
+        # have been matched to its future
+        if not send.cancelled() and send.exception() is not None and future in worker.waiting:
+            worker.waiting.remove(future)
+        worker.send_lock.release()
+
+    def _receive(self, worker):
+        try:
+            message = worker.conn.recv()
+        except (EOFError, OSError):
+            self._loop.remove_reader(worker.conn.fileno())
+            worker.alive = False
+            print(f"worker {worker.index} (pid {worker.process.pid}) exited, {self.live} of {len(self._workers)} left")
+            while worker.waiting:
+                future = worker.waiting.popleft()
+                if not future.done():
+                    future.set_exception(RuntimeError(f"worker {worker.index} exited"))
+            return
+        future = worker.waiting.popleft()
+        if not future.done():  # cancelled while the worker was scoring it
+            future.set_result(message)
+
+    async def stop(self, timeout=5.0):
+        for worker in self._workers:
+            self._loop.remove_reader(worker.conn.fileno())
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            worker.conn.close()
+        for worker in self._workers:
+            await self._loop.run_in_executor(None, worker.process.join, timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self._workers = []
+
+    def stats(self):
+        return {
+            "workers": len(self._workers),
+            "live_workers": self.live,
+            "threads_per_worker": self.threads,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "per_worker": [
+                {
+                    "pid": worker.process.pid,
+                    "alive": worker.alive and worker.process.is_alive(),
+                    "cores": sorted(worker_cores(worker.index, self.num_workers, self.threads)),
+                    "requests": worker.requests,
+                    "errors": worker.errors,
+                    "in_flight": len(worker.waiting),
+                }
+                for worker in self._workers
+            ],
+        }
+
+    # ── worker side ────────────────────────────────────────────────────
+
+    def _serve(self, index, conn, inherited):
+        # the server process shuts the workers down by closing their pipes
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        for other in inherited:
+            other.close()
+        os.sched_setaffinity(0, worker_cores(index, self.num_workers, self.threads))
+        torch.set_num_threads(self.threads)
+
+        gop = self.gop
+        timings = {}
+        gop.on_stage = lambda stage, seconds: timings.__setitem__(stage, timings.get(stage, 0.0) + seconds)
+        if self.warmup_seconds > 0:
+            model_registry.warmup(
+                model_registry.LoadedModel(gop.model, gop.processor, gop.device), seconds=self.warmup_seconds
+            )
+        conn.send(("ready", None))
+
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                break
+            if request is None:
+                break
+            sent, data, transcript = request
+            timings.clear()
+            timings["queue_wait"] = max(0.0, time.time() - sent)
+            try:
+                audio_input_values, audio_duration_sec = gop.prepare(io.BytesIO(data))
+                emission = gop.infer(audio_input_values)
+                scores = gop.score(emission, audio_duration_sec, transcript)
+                conn.send(("ok", (scores, audio_duration_sec, dict(timings))))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
@@ -0,0 +1,182 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import torch
+
+
+class QueueFull(Exception):
+    pass
+
+
+@dataclass
+class SchedulerStats:
+    requests: int = 0
+    rejected: int = 0
+    batches: int = 0
+    batch_items: int = 0
+    max_batch_size: int = 0
+    queue_wait_sec: float = 0.0
+    max_queue_wait_sec: float = 0.0
+    forward_sec: float = 0.0
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    # batch size -> number of batches of that size
+    batch_size_counts: dict = field(default_factory=dict)
+
+    def snapshot(self):
+        return {
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "mean_batch_size": self.batch_items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "batch_size_counts": dict(self.batch_size_counts),
+            "mean_queue_wait_ms": 1000 * self.queue_wait_sec / self.batch_items if self.batch_items else 0.0,
+            "max_queue_wait_ms": 1000 * self.max_queue_wait_sec,
+            "mean_forward_ms": 1000 * self.forward_sec / self.batches if self.batches else 0.0,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+        }
+
+
+class BatchScheduler:
+    """Collects concurrent wav2vec2 calls into padded batches.
+
+    `submit` queues one utterance's input values and resolves to its own
+    emission (num_frame x vocab, on the CPU). A batch is closed after
+    `max_wait_ms` or when it holds `max_batch_size` items; the model runs on a
+    dedicated thread so the event loop keeps accepting requests meanwhile.
+    """
+
+    # called as on_stage(stage, seconds) with each request's queue_wait and the
+    # forward time of its batch, from the task that submitted the request
+    on_stage = None
+
+    def __init__(self, model, device, max_batch_size=8, max_wait_ms=10.0, max_queue=64):
+        self.model = model
+        self.device = torch.device(device)
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_queue = max_queue
+        self.stats = SchedulerStats()
+        self._queue = None
+        self._task = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wav2vec2")
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._executor.shutdown(wait=True)
+
+    async def submit(self, audio_input_values):
+        """`audio_input_values` is the processor output, shape (1, samples) or (samples,)."""
+        future = asyncio.get_running_loop().create_future()
+        timings = {}
+        try:
+            self._queue.put_nowait((audio_input_values.reshape(-1), future, time.perf_counter(), timings))
+        except asyncio.QueueFull:
+            self.stats.rejected += 1
+            raise QueueFull(f"inference queue is full ({self.max_queue} requests)")
+        self.stats.requests += 1
+        self._update_depth()
+        emission = await future
+        if self.on_stage is not None:
+            for stage, seconds in timings.items():
+                self.on_stage(stage, seconds)
+        return emission
+
+    def _update_depth(self):
+        self.stats.queue_depth = self._queue.qsize()
+        self.stats.max_queue_depth = max(self.stats.max_queue_depth, self.stats.queue_depth)
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        self._update_depth()
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # callers that gave up (client disconnected) don't need a forward pass
+            batch = [item for item in batch if not item[1].cancelled()]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            for _, _, queued_at, timings in batch:
+                wait = started - queued_at
+                timings["queue_wait"] = wait
+                self.stats.queue_wait_sec += wait
+                self.stats.max_queue_wait_sec = max(self.stats.max_queue_wait_sec, wait)
+
+            try:
+                emissions = await loop.run_in_executor(
+                    self._executor, self._forward, [item[0] for item in batch]
+                )
+            except Exception as e:
+                for _, future, _, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            size = len(batch)
+            self.stats.batches += 1
+            self.stats.batch_items += size
+            self.stats.max_batch_size = max(self.stats.max_batch_size, size)
+            self.stats.batch_size_counts[size] = self.stats.batch_size_counts.get(size, 0) + 1
+            forward_sec = time.perf_counter() - started
+            self.stats.forward_sec += forward_sec
+
+            for (_, future, _, timings), emission in zip(batch, emissions):
+                timings["forward"] = forward_sec
+                if not future.done():
+                    future.set_result(emission)
+
+    def _forward(self, inputs):
+        return batch_forward(self.model, self.device, inputs)
+
+
+def batch_forward(model, device, inputs):
+    """Run wav2vec2 once over a list of 1-D input_values tensors of different
+    lengths and return one emission (num_frame x vocab, CPU) per input."""
+    # longest first, so the padded tensor is sized by the first item
+    order = sorted(range(len(inputs)), key=lambda i: len(inputs[i]), reverse=True)
+    lengths = torch.tensor([len(inputs[i]) for i in order])
+
+    input_values = torch.zeros(len(inputs), int(lengths[0]))
+    attention_mask = torch.zeros(len(inputs), int(lengths[0]), dtype=torch.long)
+    for row, i in enumerate(order):
+        input_values[row, : len(inputs[i])] = inputs[i]
+        attention_mask[row, : len(inputs[i])] = 1
+
+    with torch.inference_mode():
+        logits = model(
+            input_values.to(device), attention_mask=attention_mask.to(device)
+        ).logits.float().cpu()
+    num_frames = model._get_feat_extract_output_lengths(lengths).tolist()
+
+    emissions = [None] * len(inputs)
+    for row, i in enumerate(order):
+        emissions[i] = logits[row, : num_frames[row]].clone()
+    return emissions
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+score_corpus.py ― offline GOP scoring of a whole corpus
+======================================================
+Walks a corpus written by 1.build_corpus.py
+(<root>/<speaker>/<chapter>/transcript.txt next to <utt_id>.flac), runs
+wav2vec2 over length-bucketed batches and aligns/scores the emissions in a
+process pool. Phone-level results are written as .npy shards of a
+structured array (one row per canonical phone, keyed by utt_id); every
+utterance is listed in done.txt once its shard is on disk, so an
+interrupted run resumes where it stopped.
+
+With --alignments (a store written by alignment_store.py) the canonical
+phones and their segments come from MFA instead of phonemizing the
+transcript and aligning it with the CTC trellis; utterances missing from
+the store fall back to the trellis.
+
+Quick start
+-----------
+    python score_corpus.py data/ --out scores/ --workers 8
+    python score_corpus.py data/ --out scores_mfa/ --alignments alignments/
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+import torch
+import torchaudio
+
+import model_registry
+from alignment_store import AlignmentStore
+from gop_scores import GOP
+from scheduler import batch_forward
+
+
+DONE_FILE = "done.txt"
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Score every utterance of a LibriSpeech-style corpus")
+    p.add_argument("corpus", help="Root written by 1.build_corpus.py")
+    p.add_argument("--out", default="scores", help="Directory for the .npy shards")
+    p.add_argument("--model_dir", default=model_registry.MODEL_DIR)
+    p.add_argument("--device", default=None)
+    p.add_argument("--batch_size", type=int, default=8, help="Most utterances per forward pass")
+    p.add_argument("--batch_seconds", type=float, default=120.0, help="Most padded audio seconds per forward pass")
+    p.add_argument("--workers", type=int, default=os.cpu_count(), help="Alignment/scoring processes")
+    p.add_argument("--shard_size", type=int, default=1000, help="Utterances per output shard")
+    p.add_argument("--alignments", help="alignment_store.py directory with MFA alignments")
+    return p.parse_args()
+
+
+def discover_utterances(root: Path) -> list[tuple[str, Path, str]]:
+    """Return (utt_id, audio_path, text) for every transcript line whose audio exists."""
+    utterances = []
+    for transcript in sorted(root.glob("*/*/transcript.txt")):
+        with transcript.open(encoding="utf-8") as fh:
+            for line in fh:
+                parts = line.strip().split(maxsplit=1)
+                if len(parts) != 2:
+                    continue
+                utt_id, text = parts
+                audio = transcript.parent / f"{utt_id}.flac"
+                if audio.exists():
+                    utterances.append((utt_id, audio, text))
+    return utterances
+
+
+def make_batches(utterances, durations, batch_size, batch_seconds):
+    """Group utterances of similar length so little of each batch is padding."""
+    order = sorted(range(len(utterances)), key=lambda i: durations[i])
+    batches, batch = [], []
+    for i in order:
+        # sorted ascending, so the new item is the longest of the batch
+        if batch and (len(batch) >= batch_size or (len(batch) + 1) * durations[i] > batch_seconds):
+            batches.append(batch)
+            batch = []
+        batch.append(utterances[i])
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+# ── worker side ────────────────────────────────────────────────────────
+
+_gop = None
+_store = None
+
+
+def init_worker(model_dir: str, alignments: str | None = None):
+    global _gop, _store
+    _gop = GOP(processor=model_registry.load_processor(model_dir))
+    if alignments:
+        _store = AlignmentStore(alignments)
+
+
+def score_utterance(utt_id, emission, audio_duration_sec, text):
+    canonical, words = None, text.split()
+    if _store is not None and utt_id in _store:
+        segments, real_phones, word_pos, words = _gop.canonical_segments(_store, utt_id)
+        canonical = segments, real_phones, word_pos
+    logits, aligned_segments, aligned_predicted_segments, real_phones, word_pos = _gop.align_transcript(
+        torch.from_numpy(emission), audio_duration_sec, text, canonical
+    )
+    scores = _gop.phone_scores(aligned_segments, aligned_predicted_segments, logits)
+    rows = []
+    for word_index, (word, (start, end)) in enumerate(zip(words, word_pos)):
+        for phone_index in range(start, end):
+            real_phone, predicted_phone, score = scores[phone_index]
+            rows.append((utt_id, word_index, word, phone_index, real_phone, predicted_phone, score))
+    return utt_id, rows
+
+
+# ── output ─────────────────────────────────────────────────────────────
+
+def write_shard(out_dir: Path, index: int, rows, utt_ids):
+    columns = list(zip(*rows)) if rows else [[]] * 7
+    width = lambda col: max([len(v) for v in col] + [1])
+    dtype = [
+        ("utt_id", f"U{width(columns[0])}"),
+        ("word_index", "i4"),
+        ("word", f"U{width(columns[2])}"),
+        ("phone_index", "i4"),
+        ("real_phone", f"U{width(columns[4])}"),
+        ("predicted_phone", f"U{width(columns[5])}"),
+        ("score", "f4"),
+    ]
+    table = np.array(rows, dtype=dtype)
+
+    path = out_dir / f"scores-{index:05d}.npy"
+    tmp = out_dir / f".{path.name}.tmp"
+    with tmp.open("wb") as fh:
+        np.save(fh, table)
+    os.replace(tmp, path)
+    # only now are these utterances safe to skip on the next run
+    with (out_dir / DONE_FILE).open("a", encoding="utf-8") as fh:
+        fh.writelines(f"{utt_id}\n" for utt_id in utt_ids)
+    print(f"wrote {path.name}: {len(utt_ids)} utterances, {len(rows)} phones")
+
+
+# ── main ───────────────────────────────────────────────────────────────
+
+def main() -> None:
+    a = parse_args()
+    out_dir = Path(a.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    done = set()
+    if (out_dir / DONE_FILE).exists():
+        done = set((out_dir / DONE_FILE).read_text(encoding="utf-8").split())
+    shard_index = len(list(out_dir.glob("scores-*.npy")))
+
+    utterances = [u for u in discover_utterances(Path(a.corpus)) if u[0] not in done]
+    print(f"{len(done)} utterances already scored, {len(utterances)} to go")
+    if not utterances:
+        return
+
+    durations = []
+    for _, audio, _ in utterances:
+        info = torchaudio.info(str(audio))
+        durations.append(info.num_frames / info.sample_rate)
+    batches = make_batches(utterances, durations, a.batch_size, a.batch_seconds)
+
+    loaded = model_registry.load(a.model_dir, device=a.device)
+    gop = GOP(loaded.model, loaded.processor, loaded.device)
+
+    if a.alignments:
+        store = AlignmentStore(a.alignments)
+        missing = sum(utt_id not in store for utt_id, _, _ in utterances)
+        print(f"{len(utterances) - missing} utterances aligned by MFA, {missing} left to the trellis")
+
+    rows, shard_utts, pending = [], [], set()
+
+    def collect(futures):
+        nonlocal rows, shard_utts, shard_index
+        for future in futures:
+            try:
+                utt_id, utt_rows = future.result()
+            except Exception as e:
+                print(f"⚠️  scoring failed: {e}")
+                continue
+            rows += utt_rows
+            shard_utts.append(utt_id)
+        if len(shard_utts) >= a.shard_size:
+            write_shard(out_dir, shard_index, rows, shard_utts)
+            shard_index += 1
+            rows, shard_utts = [], []
+
+    # spawn: forking after torch has started its thread pool can deadlock
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(a.workers, mp_context=context, initializer=init_worker, initargs=(a.model_dir, a.alignments)) as pool:
+        for batch in batches:
+            prepared = [gop.prepare(str(audio)) for _, audio, _ in batch]
+            emissions = batch_forward(gop.model, gop.device, [values.reshape(-1) for values, _ in prepared])
+            for (utt_id, _, text), (_, duration), emission in zip(batch, prepared, emissions):
+                pending.add(pool.submit(score_utterance, utt_id, emission.numpy(), duration, text))
+
+            # keep the model busy, but don't let emissions pile up in memory
+            while len(pending) > 4 * a.workers:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+
+        finished, _ = wait(pending)
+        collect(finished)
+
+    if shard_utts:
+        write_shard(out_dir, shard_index, rows, shard_utts)
+    print("\n🎉  Corpus scored.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+streaming.py ― GOP scores while the learner is still speaking
+=============================================================
+* WindowedEmission runs wav2vec2 over overlapping windows of the incoming
+  audio and stitches the emission frames back together. Windows start on
+  a frame boundary (320 samples), so every window frame is a frame of the
+  whole clip; `context` frames are trimmed from both sides of a window,
+  except at the start and end of the audio.
+* StreamingScorer aligns the canonical phones to the frames received so far
+  with an open-ended trellis. A word is reported once the best path has
+  moved past it and its end lies `stable_sec` before the newest frame.
+* The final result is GOP.score on the stitched emission, so a recording no
+  longer than one window scores exactly like POST /upload-audio. Longer ones
+  differ only through the emission: each window is normalized by the
+  processor on its own and attention sees one window at most.
+
+Checking against the batch path
+-------------------------------
+    python streaming.py clip.wav "the transcript" --window 10 --context 1
+prints the largest per-phone score difference between the streamed and the
+batch result and exits 1 when it exceeds --tolerance (default 5 points on
+the 0–100 score).
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+
+import numpy as np
+import torch
+
+import alignment
+from gop_scores import Segment
+
+
+SAMPLE_RATE = 16_000
+# wav2vec2's feature encoder emits one frame per 320 samples (20 ms) from
+# 400-sample receptive fields
+SAMPLES_PER_FRAME = 320
+WINDOW_SEC = 10.0
+CONTEXT_SEC = 1.0
+STABLE_SEC = 0.5
+
+
+class WindowedEmission:
+    """Audio in, stitched emission out, with at most two windows of audio kept."""
+
+    def __init__(self, window_sec=WINDOW_SEC, context_sec=CONTEXT_SEC):
+        self.context = max(1, round(context_sec * SAMPLE_RATE / SAMPLES_PER_FRAME))
+        self.window = max(round(window_sec * SAMPLE_RATE / SAMPLES_PER_FRAME), 2 * self.context + 1)
+        self.hop = self.window - 2 * self.context
+        self.num_samples = 0
+        self.num_frames = 0
+        self._buffer = np.empty(0, dtype=np.float32)
+        self._buffer_start = 0  # sample index of _buffer[0]
+        self._next_start = 0  # frame index of the next full window
+        self._partial = b""  # odd byte of a 16-bit sample split across chunks
+        self._pieces = []
+
+    def feed(self, samples):
+        """Append samples; return the windows that are now complete as (start_frame, samples)."""
+        self._buffer = np.concatenate([self._buffer, np.asarray(samples, dtype=np.float32)])
+        self.num_samples += len(samples)
+        windows = []
+        while (self._next_start + self.window) * SAMPLES_PER_FRAME <= self.num_samples:
+            windows.append((self._next_start, self._samples(self._next_start, self._next_start + self.window)))
+            self._next_start += self.hop
+        # the final window can reach back at most one window before the next one
+        keep = max(0, self._next_start - self.window) * SAMPLES_PER_FRAME
+        if keep > self._buffer_start:
+            self._buffer = self._buffer[keep - self._buffer_start :]
+            self._buffer_start = keep
+        return windows
+
+    def feed_pcm16(self, data):
+        """`feed` for little-endian 16-bit PCM bytes."""
+        data = self._partial + data
+        usable = len(data) - len(data) % 2
+        self._partial = data[usable:]
+        return self.feed(np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768)
+
+    def split(self, samples):
+        """All windows of a complete recording as (start_frame, samples, final)."""
+        return [(start, x, False) for start, x in self.feed(samples)] + [
+            (start, x, True) for start, x in self.finish()
+        ]
+
+    def finish(self):
+        """The last window, ending with the audio; pass its emission to `add` with final=True."""
+        if self.num_samples == 0:
+            return []
+        start = min(self._next_start, max(0, self.num_samples // SAMPLES_PER_FRAME - self.window))
+        return [(start, self._samples(start, None))]
+
+    def add(self, start, emission, final=False):
+        """Stitch the emission of the window starting at frame `start`."""
+        lo = self.num_frames - start
+        assert 0 <= lo, "windows must be added in order"
+        hi = len(emission) if final else self.window - self.context
+        piece = emission[lo:hi]
+        self._pieces.append(piece)
+        self.num_frames += len(piece)
+
+    @property
+    def emission(self):
+        if len(self._pieces) > 1:
+            self._pieces = [torch.cat(self._pieces)]
+        return self._pieces[0] if self._pieces else torch.empty(0, 0)
+
+    def _samples(self, start, end):
+        lo = start * SAMPLES_PER_FRAME - self._buffer_start
+        hi = None if end is None else end * SAMPLES_PER_FRAME - self._buffer_start
+        return self._buffer[lo:hi]
+
+
+def window_emission(gop, samples):
+    """Processor and model on one window, through GOP so the stages are timed."""
+    with gop.stage("processor"):
+        input_values = gop.processor(samples, return_tensors="pt").input_values
+    return gop.infer(input_values)
+
+
+class StreamingScorer:
+    """Per-word scores from a growing emission, then the batch result at the end."""
+
+    def __init__(self, gop, transcript, stable_sec=STABLE_SEC):
+        self.gop = gop
+        self.transcript = transcript
+        self.words = transcript.split()
+        self.real_phones, self.word_pos = gop.canonical_phones(transcript)
+        tokenizer = gop.processor.tokenizer
+        self.tokens = [tokenizer.encoder.get(c, tokenizer.pad_token_id) for c in self.real_phones]
+        self.stable_frames = round(stable_sec * SAMPLE_RATE / SAMPLES_PER_FRAME)
+        self.reported = 0
+
+    def update(self, emission):
+        """Results for the words whose alignment is settled, each reported once."""
+        num_frame = emission.shape[0]
+        if self.reported == len(self.words) or not self.tokens or num_frame < 2:
+            return []
+        emission_np = emission.detach().cpu().numpy()
+        with self.gop.stage("trellis"):
+            trellis = alignment.get_trellis(emission_np, self.tokens, open_end=True)
+            end_token = alignment.best_end_token(trellis)
+        with self.gop.stage("backtrack"):
+            token_index, scores = alignment.backtrack(trellis, emission_np, self.tokens, end_token=end_token)
+            starts, ends, means = alignment.merge_runs(token_index, scores)
+        # the path visits every token up to end_token, one run each
+        run_token = token_index[starts]
+
+        settled = self.reported
+        while settled < len(self.words):
+            first, last = self.word_pos[settled]
+            if last > first:
+                if last - 1 >= end_token or ends[last - 1] > num_frame - self.stable_frames:
+                    break
+            settled += 1
+        if settled == self.reported:
+            return []
+
+        ratio = SAMPLES_PER_FRAME / SAMPLE_RATE  # seconds per frame
+        decoder = self.gop.processor.tokenizer.decoder
+        segments = [
+            Segment(self.tokens[j], self.real_phones[j], start * ratio, end * ratio, score)
+            for j, start, end, score in zip(run_token.tolist(), starts.tolist(), ends.tolist(), means.tolist())
+        ]
+        ids = emission.argmax(-1)
+        p_starts, p_ends, p_means = alignment.greedy_segments(emission_np)
+        predicted = [
+            Segment(int(i), decoder[int(i)], start * ratio, end * ratio, score)
+            for i, start, end, score in zip(ids[ids != 0].tolist(), p_starts.tolist(), p_ends.tolist(), p_means.tolist())
+        ]
+        logits = torch.softmax(emission[ids != 0], dim=-1)
+
+        results = []
+        with self.gop.stage("scoring"):
+            for w in range(self.reported, settled):
+                first, last = self.word_pos[w]
+                word_segments = segments[first:last]
+                score = self.gop.phone_scores(word_segments, predicted, logits)
+                results.append({
+                    'index': w,
+                    'word': self.words[w],
+                    'start': word_segments[0].start if word_segments else None,
+                    'end': word_segments[-1].end if word_segments else None,
+                    'phones': [
+                        {'real_phone': real, 'predicted_phone': pred, 'score': f'{gop:.2f}'}
+                        for real, pred, gop in score
+                    ],
+                })
+        self.reported = settled
+        return results
+
+    def finish(self, emission, num_samples):
+        """The same result as GOP.forward, computed from the stitched emission."""
+        return self.gop.score(emission, num_samples / SAMPLE_RATE, self.transcript)
+
+
+def stream_file(gop, waveform, transcript, window_sec=WINDOW_SEC, context_sec=CONTEXT_SEC, chunk_ms=100):
+    """Feed a 16 kHz waveform chunk by chunk; return (early word results with the
+    audio time they were sent at, final result)."""
+    windows = WindowedEmission(window_sec, context_sec)
+    scorer = StreamingScorer(gop, transcript)
+    chunk = int(SAMPLE_RATE * chunk_ms / 1000)
+    early = []
+    for i in range(0, len(waveform), chunk):
+        ready = windows.feed(waveform[i : i + chunk])
+        for start, samples in ready:
+            windows.add(start, window_emission(gop, samples))
+        if ready:
+            for word in scorer.update(windows.emission):
+                early.append((windows.num_samples / SAMPLE_RATE, word))
+    for start, samples in windows.finish():
+        windows.add(start, window_emission(gop, samples), final=True)
+    return early, scorer.finish(windows.emission, windows.num_samples)
+
+
+def main():
+    import model_registry
+    from gop_scores import GOP, get_resampler, load_audio
+
+    p = argparse.ArgumentParser(description="Compare streamed and batch GOP scores for one recording")
+    p.add_argument("audio")
+    p.add_argument("transcript")
+    p.add_argument("--window", type=float, default=WINDOW_SEC, help="window length in seconds")
+    p.add_argument("--context", type=float, default=CONTEXT_SEC, help="seconds trimmed from each side of a window")
+    p.add_argument("--chunk_ms", type=int, default=100, help="size of the simulated client chunks")
+    p.add_argument("--tolerance", type=float, default=5.0, help="largest accepted per-phone score difference")
+    a = p.parse_args()
+
+    loaded = model_registry.load()
+    gop = GOP(loaded.model, loaded.processor, loaded.device, model_id=loaded.checkpoint_id)
+
+    waveform, sample_rate = load_audio(a.audio)
+    if sample_rate != SAMPLE_RATE:
+        waveform = get_resampler(sample_rate, SAMPLE_RATE)(waveform)
+    waveform = waveform.mean(0).numpy()
+
+    start = time.perf_counter()
+    batch = gop.forward(torch.from_numpy(waveform), a.transcript, SAMPLE_RATE)
+    batch_sec = time.perf_counter() - start
+    start = time.perf_counter()
+    early, final = stream_file(gop, waveform, a.transcript, a.window, a.context, a.chunk_ms)
+    stream_sec = time.perf_counter() - start
+
+    def phones(result):
+        return [phone for word in result for phone in word['phones']]
+
+    diff = [abs(float(s['score']) - float(b['score'])) for s, b in zip(phones(final), phones(batch))]
+    same = sum(s['predicted_phone'] == b['predicted_phone'] for s, b in zip(phones(final), phones(batch)))
+    early_diff = [
+        abs(float(e['score']) - float(f['score']))
+        for _, word in early
+        for e, f in zip(word['phones'], final[word['index']]['phones'])
+    ]
+    print(f"audio {len(waveform) / SAMPLE_RATE:.1f} s, batch {batch_sec:.2f} s, streamed {stream_sec:.2f} s")
+    print(f"final vs batch: max score difference {max(diff, default=0):.3f}, "
+          f"predicted phone agrees for {same}/{len(diff)} phones")
+    print(f"{len(early)}/{len(final)} words reported early, "
+          f"max difference to the final score {max(early_diff, default=0):.3f}")
+    for sent_at, word in early:
+        print(f"  {word['word']:<15} ended {word['end']:6.2f} s, sent at {sent_at:6.2f} s")
+    if max(diff, default=0) > a.tolerance:
+        sys.exit(f"streamed scores differ by more than {a.tolerance}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+import torch
+
+import alignment
+from conftest import LABELS, peaky_emission
+
+LETTERS = LABELS[1:]
+
+
+def trellis_segments(emission, tokens):
+    trellis = alignment.get_trellis(emission, tokens)
+    return alignment.merge_runs(*alignment.backtrack(trellis, emission, tokens))
+
+
+def leading_run(tokens):
+    n = 1
+    while n < len(tokens) and tokens[n] == tokens[0]:
+        n += 1
+    return n
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_greedy_segments_match_trellis(seed):
+    rng = np.random.default_rng(seed)
+    emission = peaky_emission(rng.integers(1, len(LABELS), size=rng.integers(1, 60)), rng)
+    ids = emission.argmax(-1)
+    predicted = ids[ids != 0]
+
+    t_starts, t_ends, t_means = trellis_segments(emission, predicted)
+    g_starts, g_ends, g_means = alignment.greedy_segments(emission)
+
+    assert len(g_starts) == len(t_starts) == len(predicted)
+    differ = np.flatnonzero((t_starts != g_starts) | (t_ends != g_ends))
+    # see the greedy_segments docstring
+    allowed = set(range(leading_run(predicted))) | {len(predicted) - 2, len(predicted) - 1}
+    assert set(differ.tolist()) <= allowed
+    # the leading run's scores differ even where its boundaries agree, as
+    # the trellis charges the blank for one of its frames
+    rest = np.setdiff1d(np.arange(len(predicted)), sorted(allowed))
+    np.testing.assert_allclose(g_means[rest], t_means[rest], rtol=1e-6)
+
+
+def test_greedy_segments_without_speech():
+    emission = np.log(np.full((20, len(LABELS)), 0.01, dtype=np.float32))
+    emission[:, 0] = 0.0
+    starts, ends, means = alignment.greedy_segments(emission)
+    assert len(starts) == len(ends) == len(means) == 0
+
+
+def score_both_ways(gop, emission, transcript):
+    results = {}
+    for mode in ("trellis", "greedy"):
+        gop.predicted_alignment = mode
+        results[mode] = gop.score(torch.from_numpy(emission), emission.shape[0] * 0.02, transcript)
+    return results["trellis"], results["greedy"]
+
+
+def spoken_utterance(rng):
+    words = ["".join(rng.choice(LETTERS, size=rng.integers(2, 7))) for _ in range(rng.integers(2, 10))]
+    tokens = [LABELS.index(c) for word in words for c in word]
+    # mispronounce about one phone in five
+    spoken = [t if rng.random() > 0.2 else int(rng.integers(1, len(LABELS))) for t in tokens]
+    return " ".join(words), peaky_emission(spoken, rng)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_gen_scores_same_in_both_modes(fake_gop, seed):
+    rng = np.random.default_rng(seed)
+    transcript, emission = spoken_utterance(rng)
+    ids = emission.argmax(-1)
+    predicted = ids[ids != 0]
+
+    trellis, greedy = score_both_ways(fake_gop, emission, transcript)
+
+    assert [w["word"] for w in greedy] == [w["word"] for w in trellis]
+    for t_word, g_word in zip(trellis, greedy):
+        assert [p["real_phone"] for p in g_word["phones"]] == [p["real_phone"] for p in t_word["phones"]]
+        assert [p["predicted_phone"] for p in g_word["phones"]] == [p["predicted_phone"] for p in t_word["phones"]]
+    if leading_run(predicted) == 1:
+        # the segments differ in the last two predicted phones at most, which
+        # doesn't reach the scores of these utterances
+        assert greedy == trellis
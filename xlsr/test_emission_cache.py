@@ -0,0 +1,82 @@
+import os
+import warnings
+
+import numpy as np
+import torch
+
+import gop_scores
+from conftest import SAMPLE_RATE, FakeModel, FakeProcessor
+from gop_scores import GOP, EmissionCache
+
+
+def emission(seed, frames=50):
+    return torch.from_numpy(np.random.default_rng(seed).normal(size=(frames, 27)).astype(np.float32))
+
+
+def test_disk_hit_is_memory_mapped(tmp_path, monkeypatch):
+    original = emission(0)
+    EmissionCache(disk_dir=str(tmp_path)).put("a", original)
+
+    loaded = []
+    load = np.load
+    monkeypatch.setattr(gop_scores.np, "load", lambda *args, **kwargs: loaded.append(load(*args, **kwargs)) or loaded[-1])
+    cache = EmissionCache(disk_dir=str(tmp_path))
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")  # torch warns about non-writable arrays
+        cached = cache.get("a")
+    assert torch.equal(cached, original)
+    assert cache.stats()["disk_hits"] == 1
+    # backed by the mapping of the file, not a copy of it
+    assert isinstance(loaded[0], np.memmap)
+    assert cached.data_ptr() == loaded[0].ctypes.data
+    monkeypatch.undo()
+
+    # writing to the tensor doesn't change the file
+    cached += 1
+    assert torch.equal(EmissionCache(disk_dir=str(tmp_path)).get("a"), original)
+
+
+def test_evicted_file_stays_readable(tmp_path):
+    original = emission(1)
+    # room for one file on disk
+    cache = EmissionCache(max_memory_bytes=0, disk_dir=str(tmp_path), max_disk_bytes=original.nbytes + 1024)
+    cache.put("a", original)
+    cached = EmissionCache(disk_dir=str(tmp_path)).get("a")
+    os.utime(os.path.join(tmp_path, "a.npy"), (0, 0))  # oldest
+
+    cache.put("b", emission(2))
+    assert not os.path.exists(os.path.join(tmp_path, "a.npy"))
+    assert torch.equal(cached, original)
+
+
+def gop_with_cache(fake_phonemes, cache, chunk_sec=None):
+    gop = GOP(FakeModel(), FakeProcessor(), "cpu", phoneme_cache=fake_phonemes, model_id="fake", emission_cache=cache)
+    gop.chunk_sec = chunk_sec
+    return gop
+
+
+def test_windowed_and_whole_runs_have_different_keys(fake_phonemes):
+    whole = gop_with_cache(fake_phonemes, None)
+    windowed = gop_with_cache(fake_phonemes, None, chunk_sec=2.0)
+    audio = torch.randn(1, 5 * SAMPLE_RATE)
+    assert whole.emission_key(audio) != windowed.emission_key(audio)
+
+    wider_context = gop_with_cache(fake_phonemes, None, chunk_sec=2.0)
+    wider_context.chunk_context_sec = 0.5
+    assert wider_context.emission_key(audio) != windowed.emission_key(audio)
+
+    # a clip shorter than the window runs whole either way
+    short = torch.randn(1, SAMPLE_RATE)
+    assert whole.emission_key(short) == windowed.emission_key(short)
+
+
+def test_shared_disk_tier_keeps_windowed_and_whole_apart(fake_phonemes, tmp_path):
+    audio = torch.randn(1, 5 * SAMPLE_RATE)
+    whole = gop_with_cache(fake_phonemes, EmissionCache(disk_dir=str(tmp_path)))
+    whole.infer(audio)
+
+    windowed = gop_with_cache(fake_phonemes, EmissionCache(disk_dir=str(tmp_path)), chunk_sec=2.0)
+    emission = windowed.infer(audio)
+    assert windowed.emission_cache.stats()["disk_hits"] == 0
+    assert torch.equal(emission, gop_with_cache(fake_phonemes, None, chunk_sec=2.0).infer(audio))
+    assert len(list(tmp_path.glob("*.npy"))) == 2
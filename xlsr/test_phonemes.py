@@ -0,0 +1,40 @@
+from phonemes import PhonemeCache
+
+
+class SpellingBackend:
+    """Stands in for espeak: spells each word, and records what it was asked."""
+
+    def __init__(self):
+        self.calls = []
+
+    def phonemize(self, words, separator=None, strip=True):
+        self.calls.append(list(words))
+        return ["-".join(word) for word in words]
+
+
+def cache_with_backend(**kwargs):
+    cache = PhonemeCache(**kwargs)
+    cache._backend = SpellingBackend()
+    return cache
+
+
+def test_capitalized_words_hit_the_prewarmed_store(tmp_path):
+    vocab = tmp_path / "vocab.txt"
+    vocab.write_text("cat\nsat\nthe\n")  # lowercase, as 03.prepare_vocab.sh writes it
+    db = str(tmp_path / "phonemes.sqlite")
+    cache_with_backend(db_path=db).prewarm(vocab)
+
+    cache = cache_with_backend(db_path=db)
+    assert cache.phonemize(["The", "cat", "SAT"]) == [["t", "h", "e"], ["c", "a", "t"], ["s", "a", "t"]]
+    assert cache.backend.calls == []
+    assert cache.stats() == {"hits": 0, "disk_hits": 3, "misses": 0, "size": 3}
+
+    cache.phonemize(["the", "Cat"])
+    assert cache.stats()["hits"] == 2
+
+
+def test_misses_count_espeak_calls_only(tmp_path):
+    cache = cache_with_backend(db_path=str(tmp_path / "phonemes.sqlite"))
+    cache.phonemize(["Dog", "dog", "fish"])
+    assert cache.backend.calls == [["dog", "fish"]]
+    assert cache.stats() == {"hits": 0, "disk_hits": 0, "misses": 2, "size": 2}
@@ -0,0 +1,157 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+import threading
+import types
+
+import pytest
+import torch
+
+from prefork import NoWorkers, WorkerPool, _Worker
+
+
+class FailingSend:
+    """Connection whose send raises for one transcript, as a broken pipe would."""
+
+    def __init__(self, conn, fail_on):
+        self.conn = conn
+        self.fail_on = fail_on
+
+    def send(self, request):
+        if request[2] == self.fail_on:
+            raise BrokenPipeError("send failed")
+        self.conn.send(request)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+def echo_worker(conn, release):
+    # answers every request with its transcript, in order, once `release` is set
+    while True:
+        request = conn.recv()
+        if request is None:
+            return
+        release.wait()
+        conn.send(("ok", (request[2], 1.0, {})))
+
+
+async def run_pool(scenario, fail_on=None):
+    loop = asyncio.get_running_loop()
+    parent, child = multiprocessing.Pipe()
+    release = threading.Event()
+    thread = threading.Thread(target=echo_worker, args=(child, release), daemon=True)
+    thread.start()
+
+    pool = WorkerPool(types.SimpleNamespace(device=None), workers=1, threads=1)
+    pool._loop = loop
+    process = types.SimpleNamespace(pid=None, is_alive=lambda: thread.is_alive())
+    worker = _Worker(0, process, FailingSend(parent, fail_on) if fail_on else parent)
+    pool._workers.append(worker)
+    loop.add_reader(parent.fileno(), pool._receive, worker)
+    try:
+        # an answer matched to the wrong request leaves a future that never resolves
+        return await asyncio.wait_for(scenario(pool, release), 10), worker
+    finally:
+        loop.remove_reader(parent.fileno())
+        parent.send(None)
+        thread.join(5)
+
+
+def test_failed_send_leaves_the_order_intact():
+    async def scenario(pool, release):
+        release.set()
+        with pytest.raises(BrokenPipeError):
+            await pool.submit(b"", "lost")
+        return await pool.submit(b"", "second")
+
+    (scores, _), worker = asyncio.run(run_pool(scenario, fail_on="lost"))
+    assert scores == "second"
+    assert not worker.waiting
+
+
+def test_cancelled_request_does_not_take_the_next_answer():
+    async def scenario(pool, release):
+        first = asyncio.ensure_future(pool.submit(b"", "first"))
+        second = asyncio.ensure_future(pool.submit(b"", "second"))
+        while pool._workers[0].send_lock.locked() or len(pool._workers[0].waiting) < 2:
+            await asyncio.sleep(0.01)
+        first.cancel()
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    (scores, _), worker = asyncio.run(run_pool(scenario))
+    assert scores == "second"
+    assert not worker.waiting
+    assert worker.requests == 1
+
+
+def test_cancelled_send_keeps_the_pipe_to_itself():
+    async def scenario(pool, release):
+        release.set()
+        # cancelled while its send is still writing to the pipe, in the executor
+        first = asyncio.ensure_future(pool.submit(b"x" * 20_000_000, "first"))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        # must not write to the pipe until the first send is over
+        return await pool.submit(b"", "second")
+
+    (scores, _), worker = asyncio.run(run_pool(scenario))
+    assert scores == "second"
+    assert not worker.waiting
+
+
+def echo_gop():
+    # scores the transcript without running a model, so nothing in the forked
+    # workers touches torch's thread pool
+    return types.SimpleNamespace(
+        model=torch.nn.Linear(1, 1),
+        device=None,
+        prepare=lambda audio: (audio.read(), 1.0),
+        infer=lambda audio_input_values: audio_input_values,
+        score=lambda emission, audio_duration_sec, transcript: transcript,
+    )
+
+
+async def wait_until(condition):
+    while not condition():
+        await asyncio.sleep(0.01)
+
+
+def test_killed_worker_is_skipped():
+    async def scenario():
+        pool = WorkerPool(echo_gop(), workers=2, threads=1, warmup_seconds=0)
+        await pool.start()
+        try:
+            first, second = pool._workers
+            # stopped, the first worker holds on to the request it is sent
+            os.kill(first.process.pid, signal.SIGSTOP)
+            lost = asyncio.ensure_future(pool.submit(b"", "lost"))
+            await wait_until(lambda: first.waiting and not first.send_lock.locked())
+            os.kill(first.process.pid, signal.SIGKILL)
+            with pytest.raises(RuntimeError, match="worker 0 exited"):
+                await lost
+            assert not first.waiting
+
+            answers = [await pool.submit(b"", f"after {i}") for i in range(4)]
+            stats = pool.stats()
+
+            os.kill(second.process.pid, signal.SIGKILL)
+            await wait_until(lambda: not second.alive)
+            with pytest.raises(NoWorkers):
+                await pool.submit(b"", "none left")
+            return answers, stats, pool.stats()
+        finally:
+            await pool.stop(timeout=1)
+
+    answers, stats, after = asyncio.run(asyncio.wait_for(scenario(), 30))
+    assert [scores for scores, _ in answers] == [f"after {i}" for i in range(4)]
+    assert stats["live_workers"] == 1
+    assert [worker["alive"] for worker in stats["per_worker"]] == [False, True]
+    assert [worker["requests"] for worker in stats["per_worker"]] == [0, 4]
+    assert after["live_workers"] == 0
@@ -0,0 +1,95 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+import torch
+
+from conftest import LABELS, peaky_emission
+from gop_scores import Segment, overlap_weights
+
+LETTERS = LABELS[1:]
+
+
+def aligned_utterance(gop, seed, predicted_alignment):
+    rng = np.random.default_rng(seed)
+    words = ["".join(rng.choice(LETTERS, size=rng.integers(1, 7))) for _ in range(rng.integers(1, 12))]
+    tokens = [LABELS.index(c) for word in words for c in word]
+    # substitutions, deletions and insertions against the transcript
+    spoken = []
+    for token in tokens:
+        r = rng.random()
+        if r < 0.1:
+            continue
+        spoken.append(int(rng.integers(1, len(LABELS))) if r < 0.25 else token)
+        if rng.random() < 0.05:
+            spoken.append(int(rng.integers(1, len(LABELS))))
+    emission = torch.from_numpy(peaky_emission(spoken or tokens, rng))
+    gop.predicted_alignment = predicted_alignment
+    logits, segments, predicted_segments, _, _ = gop.align_transcript(
+        emission, emission.shape[0] * 0.02, " ".join(words)
+    )
+    return logits, segments, predicted_segments
+
+
+@pytest.mark.parametrize("predicted_alignment", ["trellis", "greedy"])
+@pytest.mark.parametrize("seed", range(25))
+def test_phone_scores_match_loop(fake_gop, predicted_alignment, seed):
+    logits, segments, predicted_segments = aligned_utterance(fake_gop, seed, predicted_alignment)
+
+    matrix = fake_gop.phone_scores(segments, predicted_segments, logits)
+    loop = fake_gop.phone_scores_loop(segments, predicted_segments, logits)
+
+    assert [row[:2] for row in matrix] == [row[:2] for row in loop]
+    # the loop sums float32 rows, the matrix version float64
+    np.testing.assert_allclose([row[2] for row in matrix], [row[2] for row in loop], rtol=1e-5)
+
+
+def test_overlap_weights_single_segments():
+    # canonical [1, 3) against predicted [0, 2) and [2, 3): overlap / union
+    # is 1/3 and 1/2, and the loop divides by the two segments it visits
+    rows, cols, weights = overlap_weights(np.array([1.0]), np.array([3.0]), np.array([0.0, 2.0]), np.array([2.0, 3.0]))
+    assert rows.tolist() == [0, 0] and cols.tolist() == [0, 1]
+    np.testing.assert_allclose(weights, [(1 / 3) / 2, (1 / 2) / 2])
+
+
+def partition(rng, num_frames):
+    """Sorted, touching [start, end) segments covering num_frames frames."""
+    bounds = np.cumsum(rng.integers(1, 8, size=num_frames))
+    bounds = np.concatenate(([0], bounds[bounds < num_frames], [num_frames]))
+    return bounds[:-1].astype(np.float64), bounds[1:].astype(np.float64)
+
+
+def weights_peak_bytes(num_frames):
+    rng = np.random.default_rng(num_frames)
+    gt_start, gt_end = partition(rng, num_frames)
+    p_start, p_end = partition(rng, num_frames)
+    tracemalloc.start()
+    try:
+        rows, _, _ = overlap_weights(gt_start, gt_end, p_start, p_end)
+        return tracemalloc.get_traced_memory()[1], len(rows), len(gt_start) + len(p_start)
+    finally:
+        tracemalloc.stop()
+
+
+def test_overlap_weights_memory_is_linear():
+    # about 3 and 24 minutes of 20 ms frames; a gt x predicted matrix would
+    # take 64x the memory for 8x the frames
+    small, pairs, segments = weights_peak_bytes(10_000)
+    large, _, _ = weights_peak_bytes(80_000)
+    assert pairs <= segments
+    assert large < 12 * small
+
+
+def test_phone_scores_match_loop_on_long_alignment(fake_gop):
+    rng = np.random.default_rng(0)
+    num_frames = 5_000
+    gt, predicted = partition(rng, num_frames), partition(rng, num_frames)
+    ids = rng.integers(1, len(LABELS), size=len(gt[0]))
+    segments = [Segment(int(i), LABELS[i], s, e, 1.0) for i, s, e in zip(ids, *gt)]
+    predicted_segments = [Segment(0, "", s, e, 1.0) for s, e in zip(*predicted)]
+    logits = torch.from_numpy(rng.normal(size=(len(predicted_segments), len(LABELS))).astype(np.float32))
+
+    matrix = fake_gop.phone_scores(segments, predicted_segments, logits)
+    loop = fake_gop.phone_scores_loop(segments, predicted_segments, logits)
+    assert [row[:2] for row in matrix] == [row[:2] for row in loop]
+    np.testing.assert_allclose([row[2] for row in matrix], [row[2] for row in loop], rtol=1e-4)
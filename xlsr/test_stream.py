@@ -0,0 +1,106 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+import torch
+
+pytest.importorskip("fastapi")
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import main
+import model_registry
+import phonemes
+from conftest import SAMPLE_RATE, FakeModel, FakeProcessor
+
+TRANSCRIPT = "the quick brown fox jumps over the lazy dog"
+
+
+@pytest.fixture
+def client(monkeypatch, fake_phonemes):
+    loaded = model_registry.LoadedModel(FakeModel(), FakeProcessor(), torch.device("cpu"), checkpoint_id="fake")
+    monkeypatch.setattr(model_registry, "load", lambda *args, **kwargs: loaded)
+    monkeypatch.setattr(phonemes, "default_cache", lambda: fake_phonemes)
+    monkeypatch.setattr(main, "PREFORK_WORKERS", 0)
+    with TestClient(main.app) as client:
+        yield client
+
+
+def pcm16(seconds, seed=0):
+    samples = np.random.default_rng(seed).normal(0.0, 0.1, int(seconds * SAMPLE_RATE))
+    return (np.clip(samples, -1, 1) * 32767).astype("<i2")
+
+
+def stream(client, transcript, pcm, chunk_bytes=3200):
+    data = pcm.tobytes()
+    messages = []
+    with client.websocket_connect("/stream") as ws:
+        ws.send_json({"transcript": transcript})
+        for i in range(0, len(data), chunk_bytes):
+            ws.send_bytes(data[i : i + chunk_bytes])
+        ws.send_json({"event": "end"})
+        while not messages or messages[-1]["type"] != "final":
+            messages.append(ws.receive_json())
+    return messages
+
+
+def test_uvicorn_accepts_websocket_upgrades():
+    # without websockets or wsproto installed uvicorn answers every upgrade with 404
+    uvicorn = pytest.importorskip("uvicorn")
+    config = uvicorn.Config(main.app, ws="auto")
+    config.load()
+    assert config.ws_protocol_class is not None
+
+
+def test_stream_final_matches_batch_scoring(client):
+    pcm = pcm16(3.0)
+    messages = stream(client, TRANSCRIPT, pcm)
+
+    # one window: exactly the result POST /upload-audio computes
+    batch = main.gop.forward(torch.from_numpy(pcm.astype(np.float32) / 32768), TRANSCRIPT, SAMPLE_RATE)
+    assert messages[-1]["result"] == batch
+    assert all(m["type"] == "word" for m in messages[:-1])
+
+
+def test_stream_reports_words_before_the_end(client, monkeypatch):
+    monkeypatch.setattr(main, "STREAM_WINDOW_SEC", 2.0)
+    monkeypatch.setattr(main, "STREAM_CONTEXT_SEC", 0.5)
+    words = TRANSCRIPT.split()
+    messages = stream(client, TRANSCRIPT, pcm16(8.0, seed=1))
+
+    early, final = messages[:-1], messages[-1]
+    assert [w["word"] for w in final["result"]] == words
+    assert early, "no word was sent before the recording ended"
+    assert [m["index"] for m in early] == list(range(len(early)))
+    for message in early:
+        assert message["word"] == words[message["index"]]
+        assert len(message["phones"]) == len(final["result"][message["index"]]["phones"])
+
+
+def test_stream_without_audio_is_closed(client):
+    with client.websocket_connect("/stream") as ws:
+        ws.send_json({"transcript": TRANSCRIPT})
+        ws.send_json({"event": "end"})
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+    assert closed.value.code == 1003
+
+
+def test_predicted_alignment_from_environment(monkeypatch, fake_phonemes):
+    monkeypatch.setattr(main, "PREDICTED_ALIGNMENT", "greedy")
+    loaded = model_registry.LoadedModel(FakeModel(), FakeProcessor(), torch.device("cpu"), checkpoint_id="fake")
+    monkeypatch.setattr(model_registry, "load", lambda *args, **kwargs: loaded)
+    monkeypatch.setattr(phonemes, "default_cache", lambda: fake_phonemes)
+    monkeypatch.setattr(main, "PREFORK_WORKERS", 0)
+    with TestClient(main.app):
+        assert main.gop.predicted_alignment == "greedy"
+
+
+def test_unknown_predicted_alignment_is_rejected():
+    env = dict(os.environ, XLSR_PREDICTED_ALIGNMENT="viterbi")
+    run = subprocess.run([sys.executable, "-c", "import main"], env=env, capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert run.returncode != 0
+    assert "XLSR_PREDICTED_ALIGNMENT must be trellis or greedy" in run.stderr